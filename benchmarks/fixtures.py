@@ -0,0 +1,78 @@
+import copy
+import csv
+import io
+import json
+import os
+import random
+
+JSON_RESPONSE_PATH = os.path.join(os.path.dirname(__file__), "..", "json", "models")
+
+
+def load_response(name: str) -> dict:
+    with open(os.path.join(JSON_RESPONSE_PATH, f"{name}.json")) as f:
+        return json.load(f)
+
+
+def get_datastore_fields() -> list[dict]:
+    return load_response("datastore_search")["result"]["fields"]
+
+
+def generate_records(number_of_rows: int, seed: int = 0) -> list[dict]:
+    """Varies the recorded datastore_search records into number_of_rows records."""
+    rng = random.Random(seed)
+    fields = get_datastore_fields()
+    templates = load_response("datastore_search")["result"]["records"]
+    records = []
+    for i in range(number_of_rows):
+        record = dict(templates[i % len(templates)])
+        for field in fields:
+            if field["id"] == "_id":
+                record["_id"] = i + 1
+            elif field["type"] in ("numeric", "int4", "int8"):
+                value = float(record.get(field["id"]) or 0)
+                record[field["id"]] = str(round(value * rng.uniform(0.8, 1.2), 1))
+        records.append(record)
+    return records
+
+
+def generate_csv(number_of_rows: int, seed: int = 0) -> bytes:
+    columns = [field["id"] for field in get_datastore_fields() if field["id"] != "_id"]
+    f = io.StringIO()
+    writer = csv.DictWriter(
+        f, fieldnames=columns, extrasaction="ignore", lineterminator="\n"
+    )
+    writer.writeheader()
+    writer.writerows(generate_records(number_of_rows, seed))
+    return f.getvalue().encode("utf-8")
+
+
+def get_package_show_response(package_id: str, base_url: str) -> dict:
+    response = copy.deepcopy(load_response("package_show"))
+    result = response["result"]
+    result["name"] = package_id
+    for resource in result.get("resources") or []:
+        resource["url"] = f"{base_url}/files/{resource['id']}.csv"
+    return response
+
+
+def get_resource_show_response(resource_id: str, base_url: str) -> dict:
+    response = copy.deepcopy(load_response("resource_show"))
+    response["result"]["id"] = resource_id
+    response["result"]["url"] = f"{base_url}/files/{resource_id}.csv"
+    return response
+
+
+def get_datastore_search_response(
+    resource_id: str, records: list[dict], offset: int, limit: int
+) -> dict:
+    response = copy.deepcopy(load_response("datastore_search"))
+    result = response["result"]
+    result["resource_id"] = resource_id
+    result["records"] = records[offset : offset + limit]
+    result["total"] = len(records)
+    result["_links"] = {
+        "start": f"/api/action/datastore_search?resource_id={resource_id}",
+        "next": f"/api/action/datastore_search?offset={offset + limit}"
+        f"&resource_id={resource_id}",
+    }
+    return response
@@ -0,0 +1,310 @@
+"""Offline benchmarks of the hot paths, served by a local stub of the data.gov.sg API.
+
+python -m benchmarks.run --rows 100000 --output results.json
+python -m benchmarks.run --baseline results.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Union
+
+from benchmarks import fixtures
+from benchmarks.stub_server import StubServer
+
+PACKAGE_ID = "resale-flat-prices"
+PACKAGE_SHOW_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "json", "models", "package_show.json"
+)
+SEARCH_PHRASES = ["resale prices", "hdb flats", "car population", "rainfall"]
+
+
+class Benchmark:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], object],
+        iterations: int,
+        setup: Callable[[], object] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.iterations = iterations
+        self.setup = setup
+
+    def run(self, warmup: int = 1) -> dict:
+        # polars and Arrow allocate outside of the Python allocator, so memory is
+        # measured as the peak RSS of the process running this benchmark alone
+        rss_before = get_peak_rss()
+        for _ in range(warmup):
+            self.call()
+        latencies = []
+        for _ in range(self.iterations):
+            latencies.append(self.call())
+        peak_rss = get_peak_rss()
+        total = sum(latencies)
+        return {
+            "iterations": self.iterations,
+            "throughput_per_second": self.iterations / total if total else None,
+            "mean_in_ms": statistics.fmean(latencies) * 1000,
+            "p50_in_ms": get_percentile(latencies, 50) * 1000,
+            "p90_in_ms": get_percentile(latencies, 90) * 1000,
+            "p99_in_ms": get_percentile(latencies, 99) * 1000,
+            "peak_rss_in_bytes": peak_rss,
+            "peak_rss_increase_in_bytes": peak_rss - rss_before,
+        }
+
+    def call(self) -> float:
+        if self.setup is not None:
+            self.setup()
+        start = time.perf_counter()
+        self.func()
+        return time.perf_counter() - start
+
+
+def get_peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    values = sorted(values)
+    index = (len(values) - 1) * percentile / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def get_commit() -> Union[str, None]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_benchmarks(
+    stub: StubServer, iterations: int, report_skipped: bool = False
+) -> list[Benchmark]:
+    # imported here so that the cache directory and endpoints are set up first
+    from govtech_data import GovTechClient
+    from govtech_data.client import API_ENDPOINTS
+    from govtech_data.models.api import (
+        PackageResourceContent,
+        datastore_result_to_dataframe,
+    )
+    from govtech_data.models.resources.datastore_search import DatastoreSearchModel
+    from govtech_data.utils import commands
+
+    for key, url in API_ENDPOINTS.items():
+        API_ENDPOINTS[key] = url.replace("https://data.gov.sg", stub.url)
+
+    package_list = GovTechClient.package_list().result
+    resource = GovTechClient.package_show(PACKAGE_ID).result.resources[0]
+    datastore_response = fixtures.get_datastore_search_response(
+        resource.id, stub.records, 0, 1000
+    )
+
+    def get_dataframe(schema_inference: str):
+        return PackageResourceContent(
+            resource=resource, content=io.BytesIO(stub.csv)
+        ).get_dataframe(None, schema_inference)
+
+    benchmarks = [
+        Benchmark(
+            "search_package",
+            lambda: GovTechClient.search_package_ids(SEARCH_PHRASES[0], package_list),
+            iterations * 10,
+        ),
+        Benchmark(
+            "search_package_batch",
+            lambda: GovTechClient.search_package_batch(SEARCH_PHRASES),
+            iterations * 10,
+        ),
+        Benchmark(
+            "package_show_uncached",
+            lambda: GovTechClient.package_show(PACKAGE_ID),
+            iterations * 10,
+            setup=GovTechClient.cache_clear,
+        ),
+        Benchmark(
+            "datastore_search_model",
+            lambda: DatastoreSearchModel(**datastore_response),
+            iterations * 10,
+        ),
+        Benchmark(
+            "datastore_result_to_dataframe",
+            lambda: datastore_result_to_dataframe(datastore_response["result"]),
+            iterations * 10,
+        ),
+        Benchmark(
+            "datastore_search_all",
+            lambda: GovTechClient.datastore_search_all(resource.id),
+            iterations,
+        ),
+        Benchmark("get_dataframe_full", lambda: get_dataframe("full"), iterations),
+        Benchmark("get_dataframe_sample", lambda: get_dataframe("sample"), iterations),
+        Benchmark(
+            "fetch_dataframe_from_package",
+            lambda: GovTechClient.fetch_dataframe_from_package(PACKAGE_ID, None),
+            iterations,
+        ),
+        Benchmark(
+            "command_get_dataset_schema",
+            lambda: commands.get_dataset_schema(PACKAGE_ID),
+            iterations * 10,
+        ),
+        Benchmark(
+            "command_get_all_distinct_values_and_counts",
+            lambda: commands.get_all_distinct_values_and_counts_in_a_dataset_field(
+                PACKAGE_ID, "town"
+            ),
+            iterations * 10,
+        ),
+    ]
+
+    # recorded metadata stands in for the dataset schema prompt, so that setting up
+    # this benchmark does not load and profile the dataset
+    with open(PACKAGE_SHOW_PATH) as f:
+        package_show_json = json.dumps(json.load(f)["result"])
+    messages = [
+        {"role": "system", "content": package_show_json},
+        {"role": "user", "content": "average resale prices by town"},
+    ] * 10
+    try:
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        from govtech_data.utils.openai import OpenAIClient
+
+        # tiktoken downloads the encoding on first use, which fails offline
+        OpenAIClient.num_tokens_from_messages(messages, "gpt-4-0613")
+    except Exception as e:
+        if report_skipped:
+            print(f"Skipping num_tokens_from_messages - {e}", file=sys.stderr)
+    else:
+        benchmarks.append(
+            Benchmark(
+                "num_tokens_from_messages",
+                lambda: OpenAIClient.num_tokens_from_messages(messages, "gpt-4-0613"),
+                iterations * 10,
+            )
+        )
+    return benchmarks
+
+
+def compare(results: dict, baseline: dict):
+    for name, result in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        change = (result["p50_in_ms"] / previous["p50_in_ms"] - 1) * 100
+        print(
+            f"{name:<45} p50 {previous['p50_in_ms']:>10.3f}ms -> "
+            f"{result['p50_in_ms']:>10.3f}ms ({change:+.1f}%)"
+        )
+
+
+def run_benchmark(name: str, rows: int, iterations: int) -> Union[dict, None]:
+    with tempfile.TemporaryDirectory() as cache_dir, StubServer(rows) as stub:
+        os.environ["GOVTECH_DATA_CACHE_DIR"] = cache_dir
+        from loguru import logger
+
+        logger.remove()
+        for benchmark in get_benchmarks(stub, iterations):
+            if benchmark.name == name:
+                return benchmark.run()
+    return None
+
+
+def run_benchmark_in_subprocess(
+    name: str, rows: int, iterations: int
+) -> Union[dict, None]:
+    """Runs a single benchmark in a new interpreter, so that its peak RSS is its own."""
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.run",
+            "--rows",
+            str(rows),
+            "--iterations",
+            str(iterations),
+            "--worker",
+            name,
+        ]
+    )
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def get_benchmark_names(rows: int, iterations: int) -> list[str]:
+    with tempfile.TemporaryDirectory() as cache_dir, StubServer(rows) as stub:
+        os.environ["GOVTECH_DATA_CACHE_DIR"] = cache_dir
+        from loguru import logger
+
+        logger.remove()
+        return [
+            benchmark.name
+            for benchmark in get_benchmarks(stub, iterations, report_skipped=True)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="rows per resource")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="only run matching benchmarks")
+    parser.add_argument("--output", default=None, help="write the results as json")
+    parser.add_argument("--baseline", default=None, help="results json to compare")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_benchmark(args.worker, args.rows, args.iterations)))
+        return
+
+    results = {
+        "meta": {
+            "commit": get_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+        },
+        "results": {},
+    }
+    for name in get_benchmark_names(args.rows, args.iterations):
+        if args.filter and args.filter not in name:
+            continue
+        result = run_benchmark_in_subprocess(name, args.rows, args.iterations)
+        if result is None:
+            continue
+        results["results"][name] = result
+        print(
+            f"{name:<45} {result['throughput_per_second']:>10.1f}/s "
+            f"p50 {result['p50_in_ms']:>10.3f}ms p99 {result['p99_in_ms']:>10.3f}ms "
+            f"peak rss {result['peak_rss_in_bytes'] / 1024 / 1024:>8.1f}MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks import fixtures
+
+
+class StubServer:
+    """Serves the recorded responses and synthetic CSVs on an ephemeral local port."""
+
+    def __init__(self, number_of_rows: int):
+        self.csv = fixtures.generate_csv(number_of_rows)
+        self.records = fixtures.generate_records(number_of_rows)
+        self.package_list = json.dumps(fixtures.load_response("package_list")).encode()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                content_type = "application/json"
+                if url.path.startswith("/files/"):
+                    body, content_type = stub.csv, "text/csv"
+                elif url.path.endswith("/package_list"):
+                    body = stub.package_list
+                elif url.path.endswith("/package_show"):
+                    body = json.dumps(
+                        fixtures.get_package_show_response(params["id"], stub.url)
+                    ).encode()
+                elif url.path.endswith("/resource_show"):
+                    body = json.dumps(
+                        fixtures.get_resource_show_response(params["id"], stub.url)
+                    ).encode()
+                elif url.path.endswith("/datastore_search"):
+                    body = json.dumps(
+                        fixtures.get_datastore_search_response(
+                            params["resource_id"],
+                            stub.records,
+                            int(params.get("offset", 0)),
+                            int(params.get("limit", 100)),
+                        )
+                    ).encode()
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,440 @@
+import asyncio
+import functools
+import json
+from collections import OrderedDict
+from typing import IO, Type, Union
+
+from loguru import logger
+from polars import DataFrame
+from pydantic import BaseModel
+
+from govtech_data.client import (
+    API_ENDPOINTS,
+    COMMON_HEADERS,
+    DEFAULT_TIMEOUT_IN_SECONDS,
+    GovTechClient,
+    concat_dataframes_with_same_schema,
+    get_conditional_headers,
+    get_package_show_version,
+    get_resource_show_version,
+    get_response_validators,
+)
+from govtech_data.models.api import (
+    DatastoreSearch,
+    PackageContent,
+    PackageResourceContent,
+    PackageShow,
+    ResourceShow,
+    SearchPackage,
+)
+from govtech_data.models.resources.datastore_search import DatastoreSearchModel
+from govtech_data.models.resources.package_list import PackageListModel
+from govtech_data.models.resources.package_show import (
+    PackageShowModel,
+    Resource as PackageShowModelResource,
+    Result as PackageShowModelResult,
+)
+from govtech_data.models.resources.resource_show import ResourceShowModel
+from govtech_data.utils import metrics
+from govtech_data.utils.cache import (
+    DEFAULT_PACKAGE_LIST_TTL_IN_SECONDS,
+    DEFAULT_PACKAGE_SHOW_TTL_IN_SECONDS,
+    DEFAULT_RESOURCE_SHOW_TTL_IN_SECONDS,
+    DiskCache,
+    MetadataCache,
+    get_cache_key,
+    get_default_cache,
+)
+from govtech_data.utils.content import (
+    CACHE_OPEN_ATTEMPTS,
+    DOWNLOAD_CHUNK_SIZE_IN_BYTES,
+    convert_file_to_io,
+)
+from govtech_data.utils.http import (
+    COMMON_SESSION_HEADERS,
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_POOL_MAXSIZE,
+    RETRY_STATUS_FORCELIST,
+)
+from govtech_data.utils.materialize import (
+    MATERIALIZE_FORMAT,
+    MaterializeFormat,
+    read_materialized,
+)
+
+try:
+    import aiohttp
+except:
+    raise Exception(
+        "aiohttp module is not installed, you may need to install govtech-data[async]"
+    )
+
+DEFAULT_CONNECTION_LIMIT = 100
+
+
+def coalesced_lru_cache(maxsize: int = 128):
+    """Caches the results of an async method per client instance.
+
+    Concurrent calls with the same arguments await a single in-flight task instead of
+    issuing duplicate requests. With maxsize=0, calls are only coalesced.
+    """
+
+    def decorator(func):
+        # not the name of func, which the metadata caches of the client already use
+        cache_name = f"coalesced_{func.__name__}"
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            cache = self._caches.setdefault(func.__name__, OrderedDict())
+            inflight = self._inflight.setdefault(func.__name__, {})
+            key = (args, tuple(sorted(kwargs.items())))
+            if key in cache:
+                metrics.record_cache(cache_name, True)
+                cache.move_to_end(key)
+                return cache[key]
+            task = inflight.get(key)
+            # awaiting an in-flight call is a hit, it saves a request all the same
+            metrics.record_cache(cache_name, task is not None)
+            if task is None:
+                task = asyncio.ensure_future(func(self, *args, **kwargs))
+                inflight[key] = task
+
+                def on_done(t: asyncio.Task):
+                    inflight.pop(key, None)
+                    if maxsize == 0 or t.cancelled() or t.exception() is not None:
+                        return
+                    cache[key] = t.result()
+                    while len(cache) > maxsize:
+                        cache.popitem(last=False)
+
+                task.add_done_callback(on_done)
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    return decorator
+
+
+def read_dataframe_from_content(
+    resource: PackageShowModelResource,
+    content: IO[bytes],
+    materialize: Union[MaterializeFormat, None],
+) -> DataFrame:
+    with content:
+        return PackageResourceContent(resource=resource, content=content).get_dataframe(
+            materialize
+        )
+
+
+def write_stream_to_cache(
+    loop: asyncio.AbstractEventLoop,
+    content: "aiohttp.StreamReader",
+    cache: DiskCache,
+    key: str,
+) -> str:
+    """Writes a response body to the cache from a worker thread.
+
+    Only the reads run on the event loop, the file writes and the eviction when the
+    entry is committed do not block it.
+    """
+    with cache.writer(key) as f:
+        while True:
+            chunk = asyncio.run_coroutine_threadsafe(
+                content.read(DOWNLOAD_CHUNK_SIZE_IN_BYTES), loop
+            ).result()
+            if not chunk:
+                break
+            f.write(chunk)
+            metrics.increment("govtech_data_downloaded_bytes_total", len(chunk))
+    return cache.get_path(key)
+
+
+class AsyncGovTechClient:
+    def __init__(
+        self,
+        session: "aiohttp.ClientSession" = None,
+        limit_per_host: int = DEFAULT_POOL_MAXSIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        cache: DiskCache = None,
+    ):
+        self._session = session
+        self._owns_session = session is None
+        self.limit_per_host = limit_per_host
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.cache = cache
+        self._caches: dict[str, OrderedDict] = {}
+        self._inflight: dict[str, dict] = {}
+        # the same TTLs and revalidation as the caches of GovTechClient
+        self.resource_show_cache = MetadataCache(
+            DEFAULT_RESOURCE_SHOW_TTL_IN_SECONDS,
+            512,
+            get_resource_show_version,
+            "resource_show",
+        )
+        self.package_show_cache = MetadataCache(
+            DEFAULT_PACKAGE_SHOW_TTL_IN_SECONDS,
+            512,
+            get_package_show_version,
+            "package_show",
+        )
+        self.package_list_cache = MetadataCache(
+            DEFAULT_PACKAGE_LIST_TTL_IN_SECONDS, 1, name="package_list"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def cache_clear(self):
+        self._caches.clear()
+        for cache in (
+            self.resource_show_cache,
+            self.package_show_cache,
+            self.package_list_cache,
+        ):
+            cache.clear()
+
+    def get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=DEFAULT_CONNECTION_LIMIT, limit_per_host=self.limit_per_host
+                ),
+                headers=COMMON_SESSION_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT_IN_SECONDS),
+            )
+        return self._session
+
+    async def get(
+        self, url: str, params: dict = None, headers: dict = None, labels: dict = None
+    ) -> "aiohttp.ClientResponse":
+        """The status of the response is added to labels when given, e.g. of a timer."""
+        # aiohttp rejects None values, requests silently drops them
+        use_params = {k: v for k, v in (params or {}).items() if v is not None}
+        for attempt in range(self.max_retries + 1):
+            resp = await self.get_session().get(url, params=use_params, headers=headers)
+            if labels is not None:
+                labels["status"] = str(resp.status)
+            if resp.status not in RETRY_STATUS_FORCELIST or attempt == self.max_retries:
+                if not resp.ok:
+                    resp.release()
+                    resp.raise_for_status()
+                return resp
+            resp.release()
+            await asyncio.sleep(self.backoff_factor * (2**attempt))
+
+    async def get_body(
+        self, url: str, params: dict = None, headers: dict = None
+    ) -> tuple["aiohttp.ClientResponse", bytes]:
+        """Reads the whole body of an API request, timed like the requests of GovTechClient."""
+        with metrics.timer(
+            "govtech_data_request_duration_seconds", endpoint=url.rsplit("/", 1)[-1]
+        ) as labels:
+            async with await self.get(
+                url, params=params, headers=headers, labels=labels
+            ) as resp:
+                body = await resp.read()
+        metrics.increment("govtech_data_downloaded_bytes_total", len(body))
+        return resp, body
+
+    async def datastore_search(
+        self, resource_id: str, **kwargs
+    ) -> Union[BaseModel, DatastoreSearchModel]:
+        kwargs["resource_id"] = resource_id
+        return await self.get_model_from_json_response(
+            API_ENDPOINTS.get("ckan_datastore_search"),
+            DatastoreSearch(**kwargs).dict(),
+            DatastoreSearchModel,
+        )
+
+    @coalesced_lru_cache(maxsize=0)
+    async def resource_show(
+        self, resource_id: str
+    ) -> Union[BaseModel, ResourceShowModel]:
+        return await self.get_cached_model_from_json_response(
+            self.resource_show_cache,
+            API_ENDPOINTS.get("ckan_resource_show"),
+            ResourceShow(**{"id": resource_id}).dict(),
+            ResourceShowModel,
+        )
+
+    @coalesced_lru_cache(maxsize=0)
+    async def package_show(self, package_id: str) -> Union[BaseModel, PackageShowModel]:
+        return await self.get_cached_model_from_json_response(
+            self.package_show_cache,
+            API_ENDPOINTS.get("ckan_package_show"),
+            PackageShow(**{"id": package_id}).dict(),
+            PackageShowModel,
+        )
+
+    @coalesced_lru_cache(maxsize=0)
+    async def package_list(self) -> Union[BaseModel, PackageListModel]:
+        return await self.get_cached_model_from_json_response(
+            self.package_list_cache,
+            API_ENDPOINTS.get("ckan_package_list"),
+            {},
+            PackageListModel,
+        )
+
+    async def search_package(self, name: str, limit: int = 10) -> list[SearchPackage]:
+        package_list_model = await self.package_list()
+        return await asyncio.to_thread(
+            GovTechClient.search_package_ids, name, package_list_model.result, limit
+        )
+
+    async def get_cached_model_from_json_response(
+        self, cache: MetadataCache, url: str, params: dict, model: Type[BaseModel]
+    ):
+        key = (url, tuple(sorted(params.items())))
+        entry, fresh = cache.lookup(key)
+        if fresh:
+            return entry[0]
+        data, validators = await self.get_conditional_json_response(
+            url, params, entry[1] if entry is not None else {}
+        )
+        return cache.revalidate(
+            key, entry, None if data is None else model(**data), validators
+        )
+
+    async def get_conditional_json_response(
+        self, url: str, params: dict, validators: dict = None
+    ) -> tuple[Union[dict, None], dict]:
+        """Returns the json body, or None if the server answered 304 Not Modified to
+        the validators of a previous response, along with the validators of this one.
+        """
+        if url is None:
+            raise Exception("url cannot be None!")
+        logger.debug(f"endpoint: {url}")
+        resp, body = await self.get_body(
+            url, params=params, headers=get_conditional_headers(validators)
+        )
+        response_validators = get_response_validators(resp.headers)
+        if resp.status == 304:
+            return None, response_validators
+        return json.loads(body), response_validators
+
+    async def get_model_from_json_response(
+        self, url: str, params: dict, model: Type[BaseModel]
+    ):
+        if url is None:
+            raise Exception("url cannot be None!")
+        if model is None:
+            raise Exception("model cannot be None!")
+        logger.debug(f"endpoint: {url}")
+        resp, body = await self.get_body(url, params=params, headers=COMMON_HEADERS)
+        return model(**json.loads(body))
+
+    async def fetch_resource(self, resource: PackageShowModelResource) -> str:
+        return await self.fetch_url_to_cache(
+            resource.url, (resource.hash, resource.last_modified)
+        )
+
+    async def open_resource(self, resource: PackageShowModelResource) -> IO[bytes]:
+        """Like fetch_resource, but the handle stays readable if the entry is evicted."""
+        for _ in range(CACHE_OPEN_ATTEMPTS):
+            path = await self.fetch_resource(resource)
+            try:
+                return await asyncio.to_thread(convert_file_to_io, path)
+            except FileNotFoundError:
+                logger.debug(f"Cache entry was evicted before it was opened - {path}")
+        raise Exception(f"Cache entry was evicted before it was opened - {path}")
+
+    @coalesced_lru_cache(maxsize=0)
+    async def fetch_url_to_cache(self, url: str, version=None) -> str:
+        use_cache = self.cache or get_default_cache()
+        key = get_cache_key(url, version)
+        path = await asyncio.to_thread(use_cache.get, key)
+        metrics.record_cache("download", path is not None)
+        if path is not None:
+            logger.debug(f"Cache hit for url - {url}")
+            return path
+        logger.debug(f"Fetching url - {url}")
+        with metrics.timer("govtech_data_download_duration_seconds"):
+            async with await self.get(url) as resp:
+                write = asyncio.ensure_future(
+                    asyncio.to_thread(
+                        write_stream_to_cache,
+                        asyncio.get_running_loop(),
+                        resp.content,
+                        use_cache,
+                        key,
+                    )
+                )
+                try:
+                    return await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # fails the read the thread is waiting on, which discards the entry
+                    resp.content.set_exception(asyncio.CancelledError())
+                    await asyncio.wait([write])
+                    raise
+
+    async def fetch_resources_from_package_result(
+        self, package_result: PackageShowModelResult, limit: int = 0
+    ) -> list[PackageResourceContent]:
+        resources = package_result.resources or []
+        if limit != 0:
+            resources = resources[:limit]
+        contents = await asyncio.gather(
+            *[self.open_resource(resource) for resource in resources]
+        )
+        return [
+            PackageResourceContent(resource=resource, content=content)
+            for resource, content in zip(resources, contents)
+        ]
+
+    async def fetch_content_from_package(
+        self, package_name: str, limit: int = 0
+    ) -> Union[PackageContent, None]:
+        package_show_model = await self.package_show(package_name)
+        if package_show_model.result is None:
+            return None
+        return PackageContent(
+            package=package_show_model.result,
+            resources=await self.fetch_resources_from_package_result(
+                package_show_model.result, limit
+            ),
+        )
+
+    async def fetch_dataframe_from_resource(
+        self,
+        resource: PackageShowModelResource,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+    ) -> DataFrame:
+        if materialize:
+            df = await asyncio.to_thread(read_materialized, resource, materialize)
+            if df is not None:
+                return df
+        content = await self.open_resource(resource)
+        return await asyncio.to_thread(
+            read_dataframe_from_content, resource, content, materialize
+        )
+
+    async def fetch_dataframe_from_package(
+        self,
+        package_name: str,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+        concat: bool = False,
+    ) -> Union[DataFrame, None]:
+        package_show_model = await self.package_show(package_name)
+        if package_show_model.result is None or not package_show_model.result.resources:
+            return None
+        resources = package_show_model.result.resources
+        if not concat:
+            return await self.fetch_dataframe_from_resource(resources[0], materialize)
+        dfs = await asyncio.gather(
+            *[
+                self.fetch_dataframe_from_resource(resource, materialize)
+                for resource in resources
+            ]
+        )
+        return concat_dataframes_with_same_schema(list(dfs))
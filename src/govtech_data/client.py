@@ -1,28 +1,73 @@
-from functools import lru_cache
-from typing import Type, Union
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Iterator, Mapping, Type, Union
+from urllib.parse import parse_qs, urlparse
 
-import requests
 from loguru import logger
-from polars import DataFrame
+from polars import DataFrame, LazyFrame, concat as concat_dataframes
 from pydantic import BaseModel, validate_arguments
-from thefuzz import fuzz, process
 
 from govtech_data.models.api import (
+    CatalogueSearchPackage,
+    DatasetProfile,
     DatastoreSearch,
     PackageShow,
     ResourceShow,
     SearchPackage,
     PackageResourceContent,
     PackageContent,
+    datastore_result_to_dataframe,
+    scan_csv,
 )
 from govtech_data.models.resources.datastore_search import DatastoreSearchModel
 from govtech_data.models.resources.package_list import PackageListModel
 from govtech_data.models.resources.package_show import (
     PackageShowModel,
+    Resource as PackageShowModelResource,
     Result as PackageShowModelResult,
 )
 from govtech_data.models.resources.resource_show import ResourceShowModel
-from govtech_data.utils.content import fetch_url, convert_response_to_io
+from govtech_data.utils import metrics
+from govtech_data.utils.cache import (
+    DEFAULT_PACKAGE_LIST_TTL_IN_SECONDS,
+    DEFAULT_PACKAGE_SHOW_TTL_IN_SECONDS,
+    DEFAULT_RESOURCE_SHOW_TTL_IN_SECONDS,
+    MetadataCache,
+)
+from govtech_data.utils.catalogue import (
+    DEFAULT_SYNC_REQUESTS_PER_SECOND,
+    Catalogue,
+    read_catalogue,
+    sync_catalogue,
+)
+from govtech_data.utils.content import fetch_url_to_cache, open_url_from_cache
+from govtech_data.utils.http import RateLimiter, get_session
+from govtech_data.utils.incremental import (
+    DATASTORE_ID_FIELD,
+    refresh_resource_dataframe,
+)
+from govtech_data.utils.materialize import (
+    MATERIALIZE_FORMAT,
+    MaterializeFormat,
+    read_materialized,
+    scan_materialized,
+)
+from govtech_data.utils.profile import get_or_compute_profile
+from govtech_data.utils.schema import (
+    SCHEMA_INFERENCE,
+    SCHEMA_INFERENCE_SAMPLE_SIZE,
+    SchemaInference,
+    cast_to_csv_schema,
+    get_schema_names,
+    read_csv_with_schema,
+    read_schema,
+)
+from govtech_data.utils.search import (
+    get_catalogue_search_index,
+    get_package_search_index,
+    search_package_ids_batch,
+)
 
 API_ENDPOINTS = {
     "ckan_datastore_search": "https://data.gov.sg/api/action/datastore_search",
@@ -35,6 +80,73 @@ COMMON_HEADERS = {"accept": "application/json"}
 
 DEFAULT_TIMEOUT_IN_SECONDS = 30
 
+DEFAULT_MAX_WORKERS = int(os.getenv("GOVTECH_DATA_MAX_WORKERS", 4))
+
+DEFAULT_SEARCH_WORKERS = int(os.getenv("GOVTECH_DATA_SEARCH_WORKERS", 1))
+
+DEFAULT_DATASTORE_PAGE_SIZE = 1000
+DEFAULT_DATASTORE_PREFETCH = 4
+
+
+def get_package_show_version(model: PackageShowModel) -> Union[tuple, None]:
+    if model.result is None or model.result.metadata_modified is None:
+        return None
+    return model.result.metadata_modified, model.result.revision_id
+
+
+def get_resource_show_version(model: ResourceShowModel) -> Union[tuple, None]:
+    if model.result is None or model.result.last_modified is None:
+        return None
+    return model.result.hash, model.result.last_modified, model.result.revision_id
+
+
+def get_conditional_headers(validators: Union[dict, None]) -> dict:
+    headers = dict(COMMON_HEADERS)
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def get_response_validators(headers: Mapping[str, str]) -> dict:
+    return {
+        name: headers[header]
+        for name, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+        if header in headers
+    }
+
+
+RESOURCE_SHOW_CACHE = MetadataCache(
+    DEFAULT_RESOURCE_SHOW_TTL_IN_SECONDS,
+    512,
+    get_resource_show_version,
+    "resource_show",
+)
+PACKAGE_SHOW_CACHE = MetadataCache(
+    DEFAULT_PACKAGE_SHOW_TTL_IN_SECONDS, 512, get_package_show_version, "package_show"
+)
+PACKAGE_LIST_CACHE = MetadataCache(
+    DEFAULT_PACKAGE_LIST_TTL_IN_SECONDS, 1, name="package_list"
+)
+
+
+def concat_dataframes_with_same_schema(dfs: list[DataFrame]) -> DataFrame:
+    same_schema_dfs = [df for df in dfs if df.schema == dfs[0].schema]
+    if len(same_schema_dfs) < len(dfs):
+        logger.warning(
+            f"Skipping {len(dfs) - len(same_schema_dfs)} resource(s) with a different schema"
+        )
+    return concat_dataframes(same_schema_dfs, how="vertical")
+
+
+def get_offset_from_link(links: Union[dict, None]) -> Union[int, None]:
+    if not links or links.get("next") is None:
+        return None
+    offset = parse_qs(urlparse(links["next"]).query).get("offset")
+    return int(offset[0]) if offset else None
+
 
 class GovTechClient:
     _instance = None
@@ -60,45 +172,275 @@ class GovTechClient:
         )
 
     @classmethod
-    @lru_cache(maxsize=512)
+    @validate_arguments
+    def datastore_search_raw(cls, resource_id: str, **kwargs) -> dict:
+        kwargs["resource_id"] = resource_id
+        return cls.get_json_response(
+            API_ENDPOINTS.get("ckan_datastore_search"),
+            DatastoreSearch(**kwargs).dict(),
+        )
+
+    @classmethod
+    def datastore_search_dataframe(cls, resource_id: str, **kwargs) -> DataFrame:
+        return datastore_result_to_dataframe(
+            cls.datastore_search_raw(resource_id, **kwargs).get("result") or {}
+        )
+
+    @classmethod
+    @validate_arguments
+    def iter_datastore_search(
+        cls,
+        resource_id: str,
+        page_size: int = DEFAULT_DATASTORE_PAGE_SIZE,
+        prefetch: int = DEFAULT_DATASTORE_PREFETCH,
+        offset: int = 0,
+        raw: bool = False,
+        **kwargs,
+    ) -> Iterator[Union[DatastoreSearchModel, dict]]:
+        for page in cls.iter_datastore_search_raw(
+            resource_id, page_size, prefetch, offset, **kwargs
+        ):
+            yield page if raw else DatastoreSearchModel(**page)
+
+    @classmethod
+    def iter_datastore_search_raw(
+        cls,
+        resource_id: str,
+        page_size: int = DEFAULT_DATASTORE_PAGE_SIZE,
+        prefetch: int = DEFAULT_DATASTORE_PREFETCH,
+        offset: int = 0,
+        **kwargs,
+    ) -> Iterator[dict]:
+        first_page = cls.datastore_search_raw(
+            resource_id, limit=page_size, offset=offset, **kwargs
+        )
+        yield first_page
+        first_result = first_page.get("result") or {}
+        if not first_result.get("records"):
+            return
+        if first_result.get("total") is None:
+            # without a total, the pages can only be followed one at a time
+            page = first_page
+            while (page.get("result") or {}).get("records"):
+                next_offset = get_offset_from_link(page["result"].get("_links"))
+                if next_offset is None:
+                    return
+                page = cls.datastore_search_raw(
+                    resource_id, limit=page_size, offset=next_offset, **kwargs
+                )
+                yield page
+            return
+        with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as executor:
+            futures = deque()
+            for page_offset in range(
+                offset + page_size, first_result["total"], page_size
+            ):
+                futures.append(
+                    executor.submit(
+                        cls.datastore_search_raw,
+                        resource_id,
+                        limit=page_size,
+                        offset=page_offset,
+                        **kwargs,
+                    )
+                )
+                if len(futures) >= prefetch:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    @classmethod
+    def iter_datastore_records(
+        cls, resource_id: str, **kwargs
+    ) -> Iterator[dict[str, Any]]:
+        for page in cls.iter_datastore_search_raw(resource_id, **kwargs):
+            yield from (page.get("result") or {}).get("records") or []
+
+    @classmethod
+    def iter_datastore_dataframes(
+        cls, resource_id: str, **kwargs
+    ) -> Iterator[DataFrame]:
+        """Yields a DataFrame per page with records.
+
+        Without any records, a single empty DataFrame with the columns in the fields of
+        the first page is yielded instead.
+        """
+        first_result, has_records = None, False
+        for page in cls.iter_datastore_search_raw(resource_id, **kwargs):
+            result = page.get("result") or {}
+            if first_result is None:
+                first_result = result
+            if not result.get("records"):
+                continue
+            has_records = True
+            yield datastore_result_to_dataframe(result)
+        if not has_records:
+            yield datastore_result_to_dataframe(first_result or {})
+
+    @classmethod
+    def datastore_search_all(cls, resource_id: str, **kwargs) -> DataFrame:
+        return concat_dataframes(
+            list(cls.iter_datastore_dataframes(resource_id, **kwargs)),
+            how="diagonal",
+        )
+
+    @classmethod
     @validate_arguments
     def resource_show(cls, resource_id: str) -> Union[BaseModel, ResourceShowModel]:
-        return cls.get_model_from_json_response(
+        return cls.get_cached_model_from_json_response(
+            RESOURCE_SHOW_CACHE,
             API_ENDPOINTS.get("ckan_resource_show"),
             ResourceShow(**{"id": resource_id}).dict(),
             ResourceShowModel,
         )
 
     @classmethod
-    @lru_cache(maxsize=512)
     @validate_arguments
     def package_show(cls, package_id: str) -> Union[BaseModel, PackageShowModel]:
-        return cls.get_model_from_json_response(
+        return cls.get_cached_model_from_json_response(
+            PACKAGE_SHOW_CACHE,
             API_ENDPOINTS.get("ckan_package_show"),
             PackageShow(**{"id": package_id}).dict(),
             PackageShowModel,
         )
 
     @classmethod
-    @lru_cache(maxsize=1)
     @validate_arguments
     def package_list(cls) -> Union[BaseModel, PackageListModel]:
-        return cls.get_model_from_json_response(
-            API_ENDPOINTS.get("ckan_package_list"), {}, PackageListModel
+        return cls.get_cached_model_from_json_response(
+            PACKAGE_LIST_CACHE,
+            API_ENDPOINTS.get("ckan_package_list"),
+            {},
+            PackageListModel,
         )
 
     @classmethod
     @validate_arguments
     def search_package(cls, name: str, limit: int = 10) -> list[SearchPackage]:
-        return [
-            SearchPackage(package_id=package_id, score=score)
-            for (package_id, score) in process.extract(
-                name,
-                cls.package_list().result,
-                scorer=fuzz.token_set_ratio,
-                limit=limit,
+        """Scores every package id with token_set_ratio, not an approximation.
+
+        The results are the same as thefuzz.process.extract over package_list.
+        """
+        return cls.search_package_ids(name, cls.package_list().result, limit)
+
+    @classmethod
+    @validate_arguments
+    def search_package_batch(
+        cls, names: list[str], limit: int = 10, workers: int = DEFAULT_SEARCH_WORKERS
+    ) -> list[SearchPackage]:
+        package_ids = cls.package_list().result
+        with metrics.timer("govtech_data_search_duration_seconds", search="batch"):
+            return search_package_ids_batch(names, package_ids, limit, workers)
+
+    @staticmethod
+    def search_package_ids(
+        name: str, package_ids: list[str], limit: int = 10
+    ) -> list[SearchPackage]:
+        with metrics.timer("govtech_data_search_duration_seconds", search="package"):
+            return get_package_search_index(package_ids).search(name, limit)
+
+    @classmethod
+    @validate_arguments
+    def search_catalogue(
+        cls, query: str, limit: int = 10, build: bool = True
+    ) -> Union[list[CatalogueSearchPackage], None]:
+        """Searches the index of the catalogue snapshot.
+
+        Without a snapshot, it is synced first if build is set, otherwise None is
+        returned. Packages added since the last sync are not in the index.
+        """
+        catalogue = cls.get_catalogue()
+        if catalogue is None:
+            if not build:
+                return None
+            catalogue = cls.sync_catalogue()
+        index = get_catalogue_search_index(catalogue)
+        with metrics.timer("govtech_data_search_duration_seconds", search="catalogue"):
+            return index.search(query, limit)
+
+    @classmethod
+    @validate_arguments
+    def fetch_package_results(
+        cls,
+        package_ids: Union[list[str], None] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        requests_per_second: float = DEFAULT_SYNC_REQUESTS_PER_SECOND,
+    ) -> list[PackageShowModelResult]:
+        if package_ids is None:
+            package_ids = cls.package_list().result
+        rate_limiter = RateLimiter(requests_per_second)
+
+        def fetch(package_id: str) -> Union[PackageShowModelResult, None]:
+            rate_limiter.acquire()
+            try:
+                return cls.package_show(package_id).result
+            except Exception:
+                logger.exception(f"Unable to fetch package - {package_id}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch, package_ids))
+        return [result for result in results if result is not None]
+
+    @classmethod
+    def fetch_package_results_from_catalogue(
+        cls, package_ids: Union[list[str], None] = None
+    ) -> list[PackageShowModelResult]:
+        """Serves package results from the catalogue snapshot, fetching the rest."""
+        catalogue = cls.get_catalogue()
+        if catalogue is None:
+            return cls.fetch_package_results(package_ids)
+        results = {
+            result.name or result.id: result
+            for result in catalogue.get_package_results(package_ids)
+        }
+        if package_ids is None:
+            return list(results.values())
+        missing_ids = [i for i in package_ids if i not in results]
+        if missing_ids:
+            for result in cls.fetch_package_results(missing_ids):
+                results[result.name or result.id] = result
+        return [results[i] for i in package_ids if i in results]
+
+    @classmethod
+    def get_catalogue(cls) -> Union[Catalogue, None]:
+        return read_catalogue()
+
+    @classmethod
+    @validate_arguments
+    def sync_catalogue(
+        cls,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        requests_per_second: float = DEFAULT_SYNC_REQUESTS_PER_SECOND,
+        max_age_in_seconds: float = 0,
+    ) -> Catalogue:
+        catalogue = sync_catalogue(
+            cls.package_list().result,
+            lambda package_id: cls.package_show(package_id).result,
+            max_workers,
+            requests_per_second,
+            max_age_in_seconds,
+        )
+        # rebuild the search index now rather than on the next search
+        get_catalogue_search_index(catalogue)
+        return catalogue
+
+    @classmethod
+    def cache_clear(cls):
+        for cache in (RESOURCE_SHOW_CACHE, PACKAGE_SHOW_CACHE, PACKAGE_LIST_CACHE):
+            cache.clear()
+
+    @classmethod
+    def get_cached_model_from_json_response(
+        cls, cache: MetadataCache, url: str, params: dict, model: Type[BaseModel]
+    ):
+        def fetch(validators: dict) -> tuple[Union[BaseModel, None], dict]:
+            data, response_validators = cls.get_conditional_json_response(
+                url, params, validators
             )
-        ]
+            return (None if data is None else model(**data)), response_validators
+
+        return cache.get_or_fetch((url, tuple(sorted(params.items()))), fetch)
 
     @classmethod
     @validate_arguments
@@ -109,37 +451,84 @@ class GovTechClient:
             raise Exception("url cannot be None!")
         if model is None:
             raise Exception("model cannot be None!")
+        return model(**cls.get_json_response(url, params))
+
+    @classmethod
+    @validate_arguments
+    def get_json_response(cls, url: str, params: dict) -> dict:
+        return cls.get_conditional_json_response(url, params)[0]
+
+    @classmethod
+    @validate_arguments
+    def get_conditional_json_response(
+        cls, url: str, params: dict, validators: dict = None
+    ) -> tuple[Union[dict, None], dict]:
+        """Returns the json body, or None if the server answered 304 Not Modified to
+        the validators of a previous response, along with the validators of this one.
+        """
+        if url is None:
+            raise Exception("url cannot be None!")
         logger.debug(f"endpoint: {url}")
-        resp = requests.get(
-            url,
-            params=params,
-            headers=COMMON_HEADERS,
-            timeout=DEFAULT_TIMEOUT_IN_SECONDS,
-        )
+        with metrics.timer(
+            "govtech_data_request_duration_seconds", endpoint=url.rsplit("/", 1)[-1]
+        ) as labels:
+            resp = get_session().get(
+                url,
+                params=params,
+                headers=get_conditional_headers(validators),
+                timeout=DEFAULT_TIMEOUT_IN_SECONDS,
+            )
+            labels["status"] = str(resp.status_code)
+        metrics.increment("govtech_data_downloaded_bytes_total", len(resp.content))
+        response_validators = get_response_validators(resp.headers)
+        if resp.status_code == 304:
+            return None, response_validators
         if not resp.ok:
             resp.raise_for_status()
-        return model(**resp.json())
+        return resp.json(), response_validators
 
     @classmethod
     @validate_arguments
     def fetch_resources_from_package_result(
-        cls, package_result: PackageShowModelResult, limit: int = 0
+        cls,
+        package_result: PackageShowModelResult,
+        limit: int = 0,
+        max_workers: int = DEFAULT_MAX_WORKERS,
     ) -> list[PackageResourceContent]:
-        r = []
-        for resource in package_result.resources:
-            if limit != 0 and len(r) >= limit:
-                break
-            resp = fetch_url(resource.url)
-            r.append(
-                PackageResourceContent(
-                    resource=resource, content=convert_response_to_io(resp)
-                )
+        resources = package_result.resources or []
+        if limit != 0:
+            resources = resources[:limit]
+
+        def fetch(resource: PackageShowModelResource) -> PackageResourceContent:
+            # opened in the worker, an open file can still be read after the write of
+            # another worker evicts it
+            return PackageResourceContent(
+                resource=resource, content=cls.open_resource(resource)
             )
-        return r
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fetch, resources))
 
     @classmethod
     @validate_arguments
-    def fetch_content_from_package(cls, package_name: str, limit: int = 0):
+    def fetch_resource(cls, resource: PackageShowModelResource) -> str:
+        return fetch_url_to_cache(
+            resource.url, version=(resource.hash, resource.last_modified)
+        )
+
+    @classmethod
+    @validate_arguments
+    def open_resource(cls, resource: PackageShowModelResource) -> IO[bytes]:
+        """Like fetch_resource, but the handle stays readable if the entry is evicted."""
+        return open_url_from_cache(
+            resource.url, version=(resource.hash, resource.last_modified)
+        )
+
+    @classmethod
+    @validate_arguments
+    def fetch_content_from_package(
+        cls, package_name: str, limit: int = 0, max_workers: int = DEFAULT_MAX_WORKERS
+    ):
         package_show_model: Union[PackageShowModel, None] = cls.package_show(
             package_name
         )
@@ -148,17 +537,151 @@ class GovTechClient:
         return PackageContent(
             package=package_show_model.result,
             resources=cls.fetch_resources_from_package_result(
-                package_show_model.result, limit
+                package_show_model.result, limit, max_workers
             ),
         )
 
     @classmethod
     @validate_arguments
-    def fetch_dataframe_from_package(cls, package_name: str) -> Union[DataFrame, None]:
-        package_content = cls.fetch_content_from_package(package_name, 1)
-        if len(package_content.resources) == 0:
+    def fetch_dataframe_from_resource(
+        cls,
+        resource: PackageShowModelResource,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+        incremental: bool = False,
+    ) -> DataFrame:
+        if incremental:
+            if resource.datastore_active:
+                return cls.refresh_dataframe_from_resource(resource)
+            logger.debug(
+                f"Resource is not in the datastore, fetching it whole - {resource.id}"
+            )
+        if materialize:
+            df = read_materialized(resource, materialize)
+            if df is not None:
+                return df
+        with cls.open_resource(resource) as content:
+            return PackageResourceContent(
+                resource=resource, content=content
+            ).get_dataframe(materialize)
+
+    @classmethod
+    def refresh_dataframe_from_resource(
+        cls, resource: PackageShowModelResource, page_size: int = None
+    ) -> DataFrame:
+        """Fetches only the datastore rows added since the last refresh of resource.
+
+        The _id column of the datastore is dropped and the columns are cast to the
+        dtypes that reading the CSV of resource gives.
+        """
+        page_size = page_size or DEFAULT_DATASTORE_PAGE_SIZE
+        df = refresh_resource_dataframe(
+            resource,
+            lambda: cls.datastore_search_raw(resource.id, limit=0)["result"]["total"],
+            lambda offset: cls.iter_datastore_dataframes(
+                resource.id, page_size=page_size, offset=offset, sort=DATASTORE_ID_FIELD
+            ),
+        )
+        if DATASTORE_ID_FIELD in df.columns:
+            df = df.drop(DATASTORE_ID_FIELD)
+        return cast_to_csv_schema(df)
+
+    @classmethod
+    @validate_arguments
+    def fetch_dataframe_from_package(
+        cls,
+        package_name: str,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+        concat: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        incremental: bool = False,
+    ) -> Union[DataFrame, None]:
+        package_show_model: Union[PackageShowModel, None] = cls.package_show(
+            package_name
+        )
+        if package_show_model.result is None or not package_show_model.result.resources:
+            return None
+        resources = package_show_model.result.resources
+        if not concat:
+            return cls.fetch_dataframe_from_resource(
+                resources[0], materialize, incremental
+            )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dfs = list(
+                executor.map(
+                    lambda resource: cls.fetch_dataframe_from_resource(
+                        resource, materialize, incremental
+                    ),
+                    resources,
+                )
+            )
+        return concat_dataframes_with_same_schema(dfs)
+
+    @classmethod
+    @validate_arguments
+    def fetch_profile_from_package(
+        cls, package_name: str
+    ) -> Union[DatasetProfile, None]:
+        package_show_model: Union[PackageShowModel, None] = cls.package_show(
+            package_name
+        )
+        if package_show_model.result is None or not package_show_model.result.resources:
+            return None
+        resource = package_show_model.result.resources[0]
+        return get_or_compute_profile(
+            resource, lambda: cls.fetch_dataframe_from_resource(resource)
+        )
+
+    @classmethod
+    @validate_arguments
+    def scan_resource(
+        cls,
+        resource: PackageShowModelResource,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+    ) -> LazyFrame:
+        """Scans the cached file of resource, which is only read when collected.
+
+        Without the cached dtypes of an earlier read, they are inferred from the first
+        rows, and collecting fails if a later value does not fit its column. Collecting
+        raises FileNotFoundError if the cache has evicted the file by then.
+        """
+        if not materialize:
+            # the dtypes of get_dataframe if the resource was parsed before, otherwise
+            # they are inferred from the first rows only
+            schema = read_schema(resource)
+            if schema is None:
+                with cls.open_resource(resource) as content:
+                    schema = get_schema_names(
+                        read_csv_with_schema(
+                            content,
+                            (
+                                SchemaInference.METADATA
+                                if SCHEMA_INFERENCE == SchemaInference.METADATA
+                                else SchemaInference.SAMPLE
+                            ),
+                            resource,
+                            n_rows=SCHEMA_INFERENCE_SAMPLE_SIZE,
+                        )
+                    )
+            return scan_csv(cls.fetch_resource(resource), schema)
+        lf = scan_materialized(resource, materialize)
+        if lf is None:
+            cls.fetch_dataframe_from_resource(resource, materialize)
+            lf = scan_materialized(resource, materialize)
+        return lf
+
+    @classmethod
+    @validate_arguments
+    def scan_package(
+        cls,
+        package_name: str,
+        materialize: Union[MaterializeFormat, None] = MATERIALIZE_FORMAT,
+    ) -> Union[LazyFrame, None]:
+        package_show_model: Union[PackageShowModel, None] = cls.package_show(
+            package_name
+        )
+        if package_show_model.result is None or not package_show_model.result.resources:
             return None
-        return package_content.resources[0].get_dataframe()
+        return cls.scan_resource(package_show_model.result.resources[0], materialize)
 
     @classmethod
     @validate_arguments
@@ -1,11 +1,41 @@
 import io
+from typing import Any, Union
 
 import polars as pl
+from loguru import logger
 from pydantic import BaseModel
 
 from govtech_data.models.resources import package_show
-
-INFER_SCHEMA_LENGTH = None  # this does a full table scan, which is slow but acceptible since most datasets are small
+from govtech_data.utils import metrics
+from govtech_data.utils.materialize import (
+    MATERIALIZE_FORMAT,
+    MaterializeFormat,
+    read_materialized,
+    write_materialized,
+)
+from govtech_data.utils.schema import (
+    SCHEMA_INFERENCE,
+    SCHEMA_INFERENCE_SAMPLE_SIZE,
+    SchemaInference,
+    get_scan_dtypes,
+    get_schema_names,
+    read_csv_with_schema,
+    write_schema,
+)
+
+INFER_SCHEMA_LENGTH = None  # this does a full table scan, set GOVTECH_DATA_SCHEMA_INFERENCE=sample to avoid it
+
+DATASTORE_FIELD_TYPES = {
+    "int": pl.Int64,
+    "int4": pl.Int64,
+    "int8": pl.Int64,
+    "float4": pl.Float64,
+    "float8": pl.Float64,
+    "numeric": pl.Float64,
+    "bool": pl.Boolean,
+    "timestamp": pl.Datetime,
+    "text": pl.Utf8,
+}
 
 
 class PackageShow(BaseModel):
@@ -32,21 +62,122 @@ class SearchPackage(BaseModel):
     score: int
 
 
+class CatalogueSearchPackage(BaseModel):
+    package_id: str
+    title: str | None
+    score: float
+
+
 class PackageResourceContent(BaseModel):
     resource: package_show.Resource
-    content: io.StringIO
+    content: io.IOBase
 
     class Config:
         arbitrary_types_allowed = True
 
-    def get_dataframe(self):
-        self.content.seek(0)
-        return pl.read_csv(
-            self.content,
-            quote_char=None,
-            use_pyarrow=True,
-            infer_schema_length=INFER_SCHEMA_LENGTH,
+    def get_dataframe(
+        self,
+        materialize: Union[MaterializeFormat, str, None] = MATERIALIZE_FORMAT,
+        schema_inference: Union[SchemaInference, str] = SCHEMA_INFERENCE,
+    ):
+        if materialize:
+            df = read_materialized(self.resource, materialize)
+            if df is not None:
+                return df
+        schema_inference = SchemaInference(schema_inference)
+        with metrics.timer(
+            "govtech_data_csv_parse_duration_seconds",
+            schema_inference=schema_inference.value,
+        ):
+            if schema_inference == SchemaInference.FULL:
+                self.content.seek(0)
+                df = pl.read_csv(
+                    self.content,
+                    quote_char=None,
+                    use_pyarrow=True,
+                    infer_schema_length=INFER_SCHEMA_LENGTH,
+                )
+            else:
+                df = read_csv_with_schema(self.content, schema_inference, self.resource)
+        metrics.increment("govtech_data_csv_rows_total", len(df))
+        # lets a later scan of the file use the same dtypes without parsing it
+        write_schema(self.resource, get_schema_names(df))
+        if materialize:
+            write_materialized(self.resource, df, materialize)
+        return df
+
+
+def scan_csv(path: str, schema: dict[str, str] = None) -> pl.LazyFrame:
+    """Scans a CSV with the dtypes of get_dataframe, given as dtype names.
+
+    Columns missing from schema are inferred from the first rows.
+    """
+    dtypes, exprs = get_scan_dtypes(schema or {})
+    lf = pl.scan_csv(
+        path,
+        quote_char=None,
+        dtypes=dtypes,
+        infer_schema_length=SCHEMA_INFERENCE_SAMPLE_SIZE,
+    )
+    return lf.with_columns(exprs) if exprs else lf
+
+
+def get_datastore_field_expr(name: str, field_type: Union[str, None]) -> pl.Expr:
+    dtype = DATASTORE_FIELD_TYPES.get(field_type, pl.Utf8)
+    if dtype == pl.Boolean:
+        return pl.col(name).cast(pl.Utf8).str.to_lowercase() == "true"
+    if dtype == pl.Datetime:
+        return pl.col(name).cast(pl.Utf8).str.strptime(pl.Datetime, strict=False)
+    return pl.col(name).cast(dtype, strict=False)
+
+
+def get_datastore_values(values: list) -> list:
+    """Turns a column of mixed JSON types (e.g. "1" and 2) into strings, which
+    polars would otherwise silently turn into nulls."""
+    types = {type(value) for value in values if value is not None}
+    if len(types) <= 1 or types <= {int, float}:
+        return values
+    return [None if value is None else str(value) for value in values]
+
+
+def datastore_result_to_dataframe(result: dict) -> pl.DataFrame:
+    """Builds a DataFrame straight from a raw datastore_search result.
+
+    Records are not validated into models, column dtypes come from result.fields.
+    """
+    records = result.get("records") or []
+    fields = result.get("fields") or [
+        {"id": name} for name in (records[0].keys() if records else [])
+    ]
+    df = pl.DataFrame(
+        {
+            field["id"]: get_datastore_values(
+                [record.get(field["id"]) for record in records]
+            )
+            for field in fields
+        }
+    )
+    if not df.width:
+        return df
+    cast_df = df.select(
+        [get_datastore_field_expr(field["id"], field.get("type")) for field in fields]
+    )
+    failed_columns = [
+        name
+        for name, null_count, cast_null_count in zip(
+            df.columns, df.null_count().row(0), cast_df.null_count().row(0)
+        )
+        if cast_null_count > null_count
+    ]
+    if failed_columns:
+        logger.warning(
+            f"Values do not fit the datastore field types, keeping them as strings - "
+            f"{failed_columns}"
         )
+        cast_df = cast_df.with_columns(
+            [df[name].cast(pl.Utf8) for name in failed_columns]
+        )
+    return cast_df
 
 
 class PackageContent(BaseModel):
@@ -54,6 +185,47 @@ class PackageContent(BaseModel):
     resources: list[PackageResourceContent] | None
 
 
+class ColumnProfile(BaseModel):
+    name: str
+    dtype: str
+    null_count: int
+    n_unique: int
+    min: Any | None
+    max: Any | None
+    value_counts: list[tuple[Any, int]] | None
+
+
+class DatasetProfile(BaseModel):
+    row_count: int
+    columns: list[ColumnProfile]
+
+    def get_column(self, name: str) -> Union[ColumnProfile, None]:
+        for column in self.columns:
+            if column.name == name:
+                return column
+        return None
+
+    def get_schema(self) -> dict[str, str]:
+        return {column.name: column.dtype for column in self.columns}
+
+    def get_schema_str(self) -> str:
+        # same format as str(DataFrame.schema)
+        return (
+            "{"
+            + ", ".join(f"'{column.name}': {column.dtype}" for column in self.columns)
+            + "}"
+        )
+
+
+class IncrementalManifest(BaseModel):
+    resource_id: str
+    hash: str | None
+    last_modified: str | None
+    total: int
+    last_id: int | None
+    chunks: list[str]
+
+
 class Messages(BaseModel):
     role: str
     content: str
@@ -55,12 +55,14 @@ class GetDatasetSchemaParameters(BaseParameter):
 class GetAllDistinctValuesInADatasetFieldParameters(BaseParameter):
     id: str = Field(description="Dataset id")
     field: str = Field(description="Field name")
+    cursor: Optional[str] = Field(description="next_cursor from a previous call, to get the next page of values")
 
 
 class SearchForRelevantValuesInADatasetFieldParameters(BaseParameter):
     id: str = Field(description="Dataset id")
     field: str = Field(description="Field name")
     value: str = Field(description="Value")
+    cursor: Optional[str] = Field(description="next_cursor from a previous call, to get the next page of values")
 
 
 class GenerateFullCodeParameters(BaseParameter):
@@ -90,7 +92,7 @@ LIST_OF_FUNCTIONS = [
     ),
     get_gpt_function(
         "get_all_distinct_values_in_a_dataset_field",
-        "Query for unique values and counts in a single field from a dataset when you have the dataset id and schema. You should NEVER call this function before dataset_search has been called in the conversation",
+        "Query for the most frequent unique values and counts in a single field from a dataset when you have the dataset id and schema. Pass next_cursor back as cursor to get more values. You should NEVER call this function before dataset_search has been called in the conversation",
         GetAllDistinctValuesInADatasetFieldParameters,
     ),
     get_gpt_function(
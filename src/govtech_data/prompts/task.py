@@ -32,7 +32,7 @@ import pandas as pd
 from matplotlib import pyplot as plt
 from govtech_data import GovTechClient
 
-df = GovTechClient.fetch_dataframe_from_package(dataset_id).to_pandas()
+df = GovTechClient.scan_package(dataset_id).select(necessary_fields).collect().to_pandas()
 ```
 
 RESPONSE:
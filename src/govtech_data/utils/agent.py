@@ -0,0 +1,369 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Union
+
+from loguru import logger
+
+from govtech_data.models import gptactions
+from govtech_data.prompts.task import KEYWORD_SUGGESTION_PROMPT, TASK_SYSTEM_PROMPT
+from govtech_data.utils import commands, metrics
+
+DEFAULT_MAX_STEPS = 15
+AGENT_WORKERS = int(os.getenv("GOVTECH_DATA_AGENT_WORKERS", 4))
+
+# shared by every agent, work submitted to it may outlive the step that started it
+_executor = ThreadPoolExecutor(
+    max_workers=AGENT_WORKERS, thread_name_prefix="govtech-data-agent"
+)
+
+
+class AgentState(str, Enum):
+    # ask the model for the next function call
+    REQUEST = "request"
+    # run the handler of the requested function
+    CALL_FUNCTION = "call_function"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class AgentStep:
+    """What happened in a single step of the agent, passed to the hooks."""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.state = AgentState.REQUEST
+        self.function_name: Union[str, None] = None
+        self.arguments: Union[dict, None] = None
+        # the message added to the history before the next step
+        self.result: Union[str, None] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.start_time = time.perf_counter()
+        self.duration_in_seconds = 0.0
+
+    def add_usage(self, usage: dict):
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+
+
+class AgentHooks:
+    """Called around every step, e.g. to record timings and token usage."""
+
+    def on_step_start(self, agent: "Agent", step: AgentStep):
+        pass
+
+    def on_step_end(self, agent: "Agent", step: AgentStep):
+        pass
+
+
+# a handler returns the message to add as the result of the function, if any
+ToolHandler = Callable[["Agent", AgentStep], Union[str, None]]
+
+
+class ToolRegistry:
+    """Maps the names of the functions offered to the model to their handlers.
+
+    Calling a terminal function completes the task.
+    """
+
+    def __init__(self):
+        self.handlers: dict[str, Union[ToolHandler, None]] = {}
+        self.terminal: set[str] = set()
+
+    def register(
+        self, name: str, handler: ToolHandler = None, terminal: bool = False
+    ) -> "ToolRegistry":
+        self.handlers[name] = handler
+        if terminal:
+            self.terminal.add(name)
+        else:
+            self.terminal.discard(name)
+        return self
+
+    def get(self, name: str) -> Union[ToolHandler, None]:
+        return self.handlers.get(name)
+
+    def is_terminal(self, name: str) -> bool:
+        return name in self.terminal
+
+    def names(self) -> list[str]:
+        return list(self.handlers)
+
+
+class Agent:
+    """Runs the function calling loop of a task one step at a time.
+
+    Every step sends the history to the model, then runs the handler of the function
+    it called and adds the result to the history for the next step. The task ends
+    when a terminal function is called, the model fails to respond, max_steps is
+    reached or cancel is called.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        registry: ToolRegistry = None,
+        hooks: list[AgentHooks] = None,
+        functions: list[dict] = gptactions.LIST_OF_FUNCTIONS,
+        task_system_prompt: str = TASK_SYSTEM_PROMPT,
+        max_steps: int = DEFAULT_MAX_STEPS,
+        prefetch: bool = True,
+    ):
+        self.client = client
+        self.registry = registry or DEFAULT_TOOL_REGISTRY
+        self.hooks = hooks or []
+        self.functions = functions
+        self.model = model
+        self.task_system_prompt = task_system_prompt
+        self.max_steps = max_steps
+        self.prefetch = prefetch
+        # package id -> profile of the dataset being loaded in the background
+        self.prefetches: dict[str, Future] = {}
+        self.state = AgentState.REQUEST
+        self.steps: list[AgentStep] = []
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stops the task before its next step, safe to call from another thread."""
+        self._cancelled.set()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Runs fn in the background, e.g. work that does not depend on the model."""
+        return _executor.submit(fn, *args)
+
+    def prefetch_dataset(self, package_id: str):
+        """Loads and profiles a dataset in the background before the model asks for it."""
+        if not self.prefetch or package_id in self.prefetches:
+            return
+        logger.debug(f"Prefetching dataset - {package_id}")
+        self.prefetches[package_id] = self.submit(commands.get_profile, package_id)
+
+    def wait_for_prefetch(self, package_id: str):
+        future = self.prefetches.get(package_id)
+        if future is None:
+            return
+        try:
+            future.result()
+        except:
+            # the command loads the dataset again and surfaces the error itself
+            logger.exception(f"Prefetching dataset failed - {package_id}")
+
+    def run(self, query: Union[str, None], role: str = "user", first_step: int = 1):
+        if len(self.client.messages_history) == 0:
+            self.client.messages_add(
+                self.client.get_message("system", self.task_system_prompt)
+            )
+        self.state = AgentState.REQUEST
+        content = query
+        for number in range(first_step, self.max_steps):
+            if self._cancelled.is_set():
+                logger.info("agent cancelled")
+                self.state = AgentState.CANCELLED
+                return False
+            step = AgentStep(number)
+            self.steps.append(step)
+            for hook in self.hooks:
+                hook.on_step_start(self, step)
+            try:
+                self.state = self.run_step(step, content, role)
+            finally:
+                step.state = self.state
+                step.duration_in_seconds = time.perf_counter() - step.start_time
+                metrics.observe(
+                    "govtech_data_agent_step_duration_seconds",
+                    step.duration_in_seconds,
+                    state=step.state.value,
+                )
+                for hook in self.hooks:
+                    hook.on_step_end(self, step)
+            if self.state == AgentState.DONE:
+                return True
+            if self.state == AgentState.FAILED:
+                return False
+            content, role = step.result, "system"
+
+        logger.error("circuit-breaker triggered to avoid an infinite query loop")
+        self.state = AgentState.FAILED
+        return False
+
+    def run_step(
+        self, step: AgentStep, content: Union[str, None], role: str
+    ) -> AgentState:
+        if content:
+            message = self.client.get_message(role, content)
+            logger.debug(f"Request:\n{message}")
+            self.client.messages_add(message)
+
+        usage = {}
+        responses = self.client.simple_query_openai(
+            self.client.messages_history,
+            functions=self.functions,
+            model=self.model,
+            n=1,
+            step=f"depth-{step.number}",
+            packing_strategy=self.client.packing_strategy,
+            usage=usage,
+            messages_tokens=self.client.get_messages_tokens(self.model),
+        )
+        step.add_usage(usage)
+        if len(responses) == 0:
+            return AgentState.FAILED
+
+        raw_response = responses[0]
+        self.client.last_response = raw_response
+        try:
+            if raw_response.get("finish_reason", None) != "function_call":
+                self.client.messages_add(
+                    self.client.get_message(
+                        "assistant", commands.json_dump(raw_response["message"])
+                    )
+                )
+                step.result = "Please return a function call"
+                return AgentState.REQUEST
+            function_call = raw_response["message"]["function_call"]
+            step.function_name = function_call["name"]
+            step.arguments = json.loads(function_call["arguments"])
+        except:
+            logger.exception(
+                f"response cannot be parsed! ChatGPT content response:\n{raw_response}"
+            )
+            self.client.messages_add(
+                self.client.get_message("assistant", commands.json_dump(raw_response))
+            )
+            return AgentState.REQUEST
+
+        logger.debug(f"ChatGPT content response:\n{function_call}")
+        metrics.increment(
+            "govtech_data_agent_function_calls_total", function=step.function_name
+        )
+        self.client.messages_add(
+            self.client.get_function_message(
+                step.function_name, commands.json_dump(step.arguments)
+            )
+        )
+        return self.call_function(step)
+
+    def call_function(self, step: AgentStep) -> AgentState:
+        self.state = AgentState.CALL_FUNCTION
+        if self.registry.is_terminal(step.function_name):
+            return AgentState.DONE
+        handler = self.registry.get(step.function_name)
+        if handler is None:
+            logger.warning(f"No handler for function - {step.function_name}")
+            return AgentState.REQUEST
+        step.result = handler(self, step)
+        return AgentState.REQUEST
+
+
+def dataset_search(agent: Agent, step: AgentStep) -> Union[str, None]:
+    query = step.arguments.get("input")
+    catalogue_results = commands.search_catalogue_datasets(query)
+    if catalogue_results is not None:
+        # the catalogue index already ranks on titles, descriptions and tags, skip the
+        # keyword suggestions
+        if catalogue_results:
+            agent.prefetch_dataset(catalogue_results[0].package_id)
+        return commands.format_catalogue_search_results(catalogue_results)
+
+    # the search for the input itself does not need the suggested keywords
+    input_results = agent.submit(commands.search_datasets, [query])
+    phrases = suggest_keyword_phrases(agent, step, query)
+    results = commands.merge_search_results(
+        input_results.result(), commands.search_datasets(phrases) if phrases else []
+    )
+    if results:
+        agent.prefetch_dataset(results[0].package_id)
+    return commands.format_dataset_search_results(results)
+
+
+def suggest_keyword_phrases(agent: Agent, step: AgentStep, query: str) -> list[str]:
+    messages = [
+        agent.client.get_message("system", KEYWORD_SUGGESTION_PROMPT),
+        agent.client.get_function_message(
+            step.function_name, commands.json_dump(step.arguments)
+        ),
+        agent.client.get_message("user", query),
+    ]
+    usage = {}
+    responses = agent.client.simple_query_openai(
+        messages,
+        functions=gptactions.KEYWORD_PHRASES_FUNCTION,
+        model=agent.model,
+        temperature=0.7,
+        n=1,
+        step="keyword_suggestion",
+        usage=usage,
+    )
+    step.add_usage(usage)
+    try:
+        if responses and responses[0].get("finish_reason") == "function_call":
+            function_call = responses[0]["message"]["function_call"]
+            logger.debug(f"ChatGPT ss_response_data:\n{function_call}")
+            return json.loads(function_call["arguments"]).get("phrases", [])
+    except:
+        logger.exception(f"response cannot be parsed! ChatGPT response:\n{responses}")
+    return []
+
+
+def get_dataset_schema(agent: Agent, step: AgentStep) -> Union[str, None]:
+    agent.wait_for_prefetch(step.arguments.get("id"))
+    return commands.get_dataset_schema(step.arguments.get("id"))
+
+
+def get_all_distinct_values_in_a_dataset_field(
+    agent: Agent, step: AgentStep
+) -> Union[str, None]:
+    agent.wait_for_prefetch(step.arguments.get("id"))
+    return commands.get_all_distinct_values_in_a_dataset_field(
+        step.arguments.get("id"),
+        step.arguments.get("field"),
+        step.arguments.get("cursor"),
+        count_tokens=agent.client.get_text_tokens_counter(agent.model),
+    )
+
+
+def search_for_relevant_values_in_a_dataset_field(
+    agent: Agent, step: AgentStep
+) -> Union[str, None]:
+    agent.wait_for_prefetch(step.arguments.get("id"))
+    return commands.search_for_relevant_values_in_a_dataset_field(
+        step.arguments.get("id"),
+        step.arguments.get("field"),
+        step.arguments.get("value"),
+        step.arguments.get("cursor"),
+        count_tokens=agent.client.get_text_tokens_counter(agent.model),
+    )
+
+
+def generate_full_code(agent: Agent, step: AgentStep) -> Union[str, None]:
+    return "Fix and optimize the following code"
+
+
+def do_nothing(agent: Agent, step: AgentStep) -> Union[str, None]:
+    return None
+
+
+DEFAULT_TOOL_REGISTRY = (
+    ToolRegistry()
+    .register("dataset_search", dataset_search)
+    .register("get_dataset", get_dataset_schema)
+    .register("get_dataset_schema", get_dataset_schema)
+    .register(
+        "get_all_distinct_values_in_a_dataset_field",
+        get_all_distinct_values_in_a_dataset_field,
+    )
+    .register(
+        "search_for_relevant_values_in_a_dataset_field",
+        search_for_relevant_values_in_a_dataset_field,
+    )
+    .register("do_nothing", do_nothing)
+    .register("generate_full_code", generate_full_code)
+    .register("generate_optimized_code", terminal=True)
+    .register("task_complete", terminal=True)
+)
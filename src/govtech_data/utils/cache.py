@@ -0,0 +1,350 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator, Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.utils import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "GOVTECH_DATA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "govtech_data"),
+)
+DEFAULT_CACHE_MAX_SIZE_IN_BYTES = int(
+    os.getenv("GOVTECH_DATA_CACHE_MAX_SIZE_IN_BYTES", 2 * 1024 * 1024 * 1024)
+)
+
+DEFAULT_DATAFRAME_CACHE_MAX_SIZE_IN_BYTES = int(
+    os.getenv("GOVTECH_DATA_DATAFRAME_CACHE_MAX_SIZE_IN_BYTES", 512 * 1024 * 1024)
+)
+
+DEFAULT_PACKAGE_LIST_TTL_IN_SECONDS = int(
+    os.getenv("GOVTECH_DATA_PACKAGE_LIST_TTL_IN_SECONDS", 60 * 60)
+)
+DEFAULT_PACKAGE_SHOW_TTL_IN_SECONDS = int(
+    os.getenv("GOVTECH_DATA_PACKAGE_SHOW_TTL_IN_SECONDS", 10 * 60)
+)
+DEFAULT_RESOURCE_SHOW_TTL_IN_SECONDS = int(
+    os.getenv("GOVTECH_DATA_RESOURCE_SHOW_TTL_IN_SECONDS", 10 * 60)
+)
+
+LOCK_FILENAME = ".lock"
+TEMP_FILE_PREFIX = ".tmp-"
+
+
+def get_cache_key(*parts) -> str:
+    return hashlib.sha256(
+        "\0".join("" if p is None else str(p) for p in parts).encode("utf-8")
+    ).hexdigest()
+
+
+class DiskCache:
+    """File cache shared by every process that uses the same directory.
+
+    Entries are written to a temporary file and atomically renamed into place, so
+    readers never see a partial file. The modification time of an entry is bumped on
+    every hit and used for LRU eviction once the total size exceeds max_size_in_bytes.
+
+    Any process can evict an entry between its lookup and its use, readers open the
+    path right away and treat FileNotFoundError as a miss. An open file stays
+    readable after it is evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_size_in_bytes: int = DEFAULT_CACHE_MAX_SIZE_IN_BYTES,
+    ):
+        self.directory = directory
+        self.max_size_in_bytes = max_size_in_bytes
+        self._thread_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_path(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get(self, key: str, suffix: str = "") -> Union[str, None]:
+        """Returns the path of the entry, which may be evicted before it is opened."""
+        path = self.get_path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def contains(self, key: str, suffix: str = "") -> bool:
+        return os.path.exists(self.get_path(key, suffix))
+
+    @contextmanager
+    def writer(self, key: str, suffix: str = "") -> Iterator:
+        path = self.get_path(key, suffix)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_FILE_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        # the caller is about to read the entry it just wrote
+        self.evict(keep=path)
+
+    def put(self, key: str, data: bytes, suffix: str = "") -> str:
+        with self.writer(key, suffix) as f:
+            f.write(data)
+        return self.get_path(key, suffix)
+
+    def remove(self, key: str, suffix: str = ""):
+        try:
+            os.remove(self.get_path(key, suffix))
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def clear(self):
+        with self.lock():
+            for entry in self._entries():
+                self._remove_entry(entry.path)
+
+    def evict(self, keep: str = None):
+        """Removes the least recently used entries, except keep, until the rest fit.
+
+        keep stays even if it is larger than max_size_in_bytes on its own, it is
+        evicted by a later write.
+        """
+        if self.max_size_in_bytes is None or self.max_size_in_bytes <= 0:
+            return
+        with self.lock():
+            entries = []
+            for entry in self._entries():
+                try:
+                    entries.append((entry.stat(), entry.path))
+                except FileNotFoundError:
+                    continue
+            total_size = sum(stat.st_size for stat, _ in entries)
+            if total_size <= self.max_size_in_bytes:
+                return
+            for stat, path in sorted(entries, key=lambda x: x[0].st_mtime):
+                if total_size <= self.max_size_in_bytes:
+                    break
+                if path == keep:
+                    logger.debug(f"Cache entry is larger than the cache - {path}")
+                    continue
+                logger.debug(f"Evicting cache entry - {path}")
+                self._remove_entry(path)
+                total_size -= stat.st_size
+
+    @contextmanager
+    def lock(self) -> Iterator:
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, LOCK_FILENAME), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entries(self) -> Iterator[os.DirEntry]:
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name == LOCK_FILENAME or entry.name.startswith(
+                    TEMP_FILE_PREFIX
+                ):
+                    continue
+                if entry.is_file():
+                    yield entry
+
+    @staticmethod
+    def _remove_entry(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class DataFrameCache:
+    """In-memory LRU cache of DataFrames bounded by their estimated size in bytes."""
+
+    def __init__(
+        self, max_size_in_bytes: int = DEFAULT_DATAFRAME_CACHE_MAX_SIZE_IN_BYTES
+    ):
+        self.max_size_in_bytes = max_size_in_bytes
+        self.size_in_bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[pl.DataFrame, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Union[pl.DataFrame, None]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.record_cache("dataframe", entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: Hashable, df: pl.DataFrame) -> pl.DataFrame:
+        size_in_bytes = df.estimated_size()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_in_bytes -= previous[1]
+            if size_in_bytes > self.max_size_in_bytes:
+                logger.debug(f"DataFrame is larger than the cache, not caching - {key}")
+                return df
+            self._entries[key] = (df, size_in_bytes)
+            self.size_in_bytes += size_in_bytes
+            while self.size_in_bytes > self.max_size_in_bytes:
+                _, (_, evicted_size_in_bytes) = self._entries.popitem(last=False)
+                self.size_in_bytes -= evicted_size_in_bytes
+        return df
+
+    def get_or_load(
+        self, key: Hashable, load: Callable[[], Union[pl.DataFrame, None]]
+    ) -> Union[pl.DataFrame, None]:
+        df = self.get(key)
+        if df is not None:
+            return df
+        df = load()
+        if df is None:
+            return None
+        return self.put(key, df)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_in_bytes = 0
+
+
+class MetadataCache:
+    """In-memory LRU cache of API responses that are revalidated once their TTL expires.
+
+    fetch is called with the validators of the cached response, e.g. its ETag, and
+    returns the new value, or None if the server answered 304 Not Modified, along with
+    the validators of the new response. When get_version is given, a refetched value
+    with the same version as the cached one is discarded in favour of the cached one.
+    """
+
+    def __init__(
+        self,
+        ttl_in_seconds: float,
+        maxsize: int = 512,
+        get_version: Callable[[Any], Hashable] = None,
+        name: str = "metadata",
+    ):
+        self.name = name
+        self.ttl_in_seconds = ttl_in_seconds
+        self.maxsize = maxsize
+        self.get_version = get_version
+        # key -> (value, validators, expires_at)
+        self._entries: OrderedDict[Hashable, tuple[Any, dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[dict], tuple[Union[Any, None], dict]],
+    ) -> Any:
+        entry, fresh = self.lookup(key)
+        if fresh:
+            return entry[0]
+        value, validators = fetch(entry[1] if entry is not None else {})
+        return self.revalidate(key, entry, value, validators)
+
+    def lookup(self, key: Hashable) -> tuple[Union[tuple, None], bool]:
+        """Returns the cached entry of key, if any, and whether its TTL has not expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry[2] > time.monotonic():
+            metrics.record_cache(self.name, True)
+            return entry, True
+        metrics.record_cache(self.name, False)
+        return entry, False
+
+    def revalidate(
+        self,
+        key: Hashable,
+        entry: Union[tuple, None],
+        value: Union[Any, None],
+        validators: dict,
+    ) -> Any:
+        """Stores the response fetched with the validators of entry, returns its value."""
+        if entry is not None:
+            if value is None:
+                logger.debug(f"Cached response is not modified - {key}")
+                metrics.increment(
+                    "govtech_data_cache_revalidations_total",
+                    cache=self.name,
+                    result="not_modified",
+                )
+                value = entry[0]
+                validators = validators or entry[1]
+            elif self.get_version is not None:
+                version = self.get_version(value)
+                if version is not None and version == self.get_version(entry[0]):
+                    logger.debug(f"Cached response has the same version - {key}")
+                    metrics.increment(
+                        "govtech_data_cache_revalidations_total",
+                        cache=self.name,
+                        result="same_version",
+                    )
+                    value = entry[0]
+                    validators = validators or entry[1]
+        elif value is None:
+            raise Exception(f"Received not modified without a cached response - {key}")
+
+        with self._lock:
+            self._entries[key] = (
+                value,
+                validators,
+                time.monotonic() + self.ttl_in_seconds,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> DiskCache:
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = DiskCache()
+    return _default_cache
+
+
+def set_default_cache(cache: DiskCache):
+    global _default_cache
+    _default_cache = cache
@@ -0,0 +1,291 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.models.resources.package_show import Result as PackageShowModelResult
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+from govtech_data.utils.http import RateLimiter
+
+DEFAULT_SYNC_REQUESTS_PER_SECOND = float(
+    os.getenv("GOVTECH_DATA_SYNC_REQUESTS_PER_SECOND", 10)
+)
+CATALOGUE_PACKAGES_CACHE_SUFFIX = ".catalogue-packages.arrow"
+CATALOGUE_RESOURCES_CACHE_SUFFIX = ".catalogue-resources.arrow"
+
+CATALOGUE_PACKAGES_SCHEMA = {
+    "package_id": pl.Utf8,
+    "title": pl.Utf8,
+    "organization": pl.Utf8,
+    "tags": pl.List(pl.Utf8),
+    "frequency": pl.Utf8,
+    "metadata_modified": pl.Utf8,
+    "revision_id": pl.Utf8,
+    "num_resources": pl.Int64,
+    "synced_at": pl.Float64,
+    # the full package_show result, so that it can be served without a request
+    "package_json": pl.Utf8,
+}
+CATALOGUE_RESOURCES_SCHEMA = {
+    "package_id": pl.Utf8,
+    "resource_id": pl.Utf8,
+    "name": pl.Utf8,
+    "format": pl.Utf8,
+    "url": pl.Utf8,
+    "hash": pl.Utf8,
+    "last_modified": pl.Utf8,
+    "datastore_active": pl.Boolean,
+    "position": pl.Int64,
+}
+
+
+def get_package_row(result: PackageShowModelResult, synced_at: float) -> dict:
+    organization = result.organization
+    return {
+        "package_id": result.name or result.id,
+        "title": result.title,
+        "organization": (
+            (organization.title or organization.name) if organization else None
+        ),
+        "tags": [i.name for i in result.tags or [] if i.name],
+        "frequency": result.frequency,
+        "metadata_modified": result.metadata_modified,
+        "revision_id": result.revision_id,
+        "num_resources": len(result.resources or []),
+        "synced_at": synced_at,
+        "package_json": result.json(),
+    }
+
+
+def get_resource_rows(result: PackageShowModelResult) -> list[dict]:
+    return [
+        {
+            "package_id": result.name or result.id,
+            "resource_id": resource.id,
+            "name": resource.name,
+            "format": resource.format,
+            "url": resource.url,
+            "hash": resource.hash,
+            "last_modified": resource.last_modified,
+            "datastore_active": resource.datastore_active,
+            "position": resource.position,
+        }
+        for resource in result.resources or []
+    ]
+
+
+class Catalogue:
+    """Snapshot of the package_show metadata of every package.
+
+    packages has one row per package and resources one row per resource, both are
+    saved as Arrow IPC and memory-mapped on load.
+    """
+
+    def __init__(self, packages: pl.DataFrame, resources: pl.DataFrame):
+        self.packages = packages
+        self.resources = resources
+        self._version: Union[str, None] = None
+
+    def __len__(self) -> int:
+        return len(self.packages)
+
+    @classmethod
+    def build(
+        cls, results: list[PackageShowModelResult], synced_at: float = None
+    ) -> "Catalogue":
+        synced_at = time.time() if synced_at is None else synced_at
+        return cls(
+            pl.DataFrame(
+                [get_package_row(result, synced_at) for result in results],
+                schema=CATALOGUE_PACKAGES_SCHEMA,
+            ),
+            pl.DataFrame(
+                [row for result in results for row in get_resource_rows(result)],
+                schema=CATALOGUE_RESOURCES_SCHEMA,
+            ),
+        )
+
+    @classmethod
+    def load(cls, packages_path: str, resources_path: str) -> "Catalogue":
+        return cls(
+            pl.read_ipc(packages_path, memory_map=True),
+            pl.read_ipc(resources_path, memory_map=True),
+        )
+
+    def save(self, packages_path: str, resources_path: str):
+        self.packages.write_ipc(packages_path, compression="uncompressed")
+        self.resources.write_ipc(resources_path, compression="uncompressed")
+
+    def get_version(self) -> str:
+        """Identifies the package metadata in the snapshot, synced_at is left out."""
+        if self._version is None:
+            self._version = hashlib.sha256(
+                "\n".join(self.packages["package_json"]).encode("utf-8")
+            ).hexdigest()
+        return self._version
+
+    def get_metadata_modified(self) -> dict[str, tuple[str, float]]:
+        return {
+            package_id: (metadata_modified, synced_at)
+            for package_id, metadata_modified, synced_at in self.packages.select(
+                ["package_id", "metadata_modified", "synced_at"]
+            ).iter_rows()
+        }
+
+    def get_package_result(
+        self, package_id: str
+    ) -> Union[PackageShowModelResult, None]:
+        rows = self.packages.filter(pl.col("package_id") == package_id)
+        if len(rows) == 0:
+            return None
+        return PackageShowModelResult.parse_raw(rows["package_json"][0])
+
+    def get_package_results(
+        self, package_ids: Union[list[str], None] = None
+    ) -> list[PackageShowModelResult]:
+        packages = self.packages
+        if package_ids is not None:
+            packages = packages.filter(pl.col("package_id").is_in(package_ids))
+        return [
+            PackageShowModelResult.parse_raw(package_json)
+            for package_json in packages["package_json"]
+        ]
+
+    def update(
+        self,
+        results: list[PackageShowModelResult],
+        package_ids: list[str],
+        synced_at: float = None,
+    ) -> "Catalogue":
+        """Returns a catalogue with results replacing their previous rows.
+
+        Packages that are no longer in package_ids are dropped.
+        """
+        updated = Catalogue.build(results, synced_at)
+        replaced_ids = updated.packages["package_id"]
+        keep = pl.col("package_id").is_in(package_ids) & ~pl.col("package_id").is_in(
+            replaced_ids
+        )
+        return Catalogue(
+            pl.concat([self.packages.filter(keep), updated.packages]),
+            pl.concat([self.resources.filter(keep), updated.resources]),
+        )
+
+
+_catalogue: Union[tuple[tuple, Catalogue], None] = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue_key() -> str:
+    return get_cache_key("catalogue")
+
+
+def read_catalogue(cache: DiskCache = None) -> Union[Catalogue, None]:
+    global _catalogue
+    use_cache = cache or get_default_cache()
+    packages_path = use_cache.get(get_catalogue_key(), CATALOGUE_PACKAGES_CACHE_SUFFIX)
+    resources_path = use_cache.get(
+        get_catalogue_key(), CATALOGUE_RESOURCES_CACHE_SUFFIX
+    )
+    if packages_path is None or resources_path is None:
+        return None
+    try:
+        # the snapshot is replaced atomically and cache hits bump the mtime, so the
+        # inode identifies the snapshot
+        version = (os.stat(packages_path).st_ino, os.stat(resources_path).st_ino)
+        catalogue = _catalogue
+        if catalogue is not None and catalogue[0] == version:
+            return catalogue[1]
+        with _catalogue_lock:
+            _catalogue = (version, Catalogue.load(packages_path, resources_path))
+    except FileNotFoundError:
+        logger.debug("Catalogue snapshot was evicted")
+        return None
+    return _catalogue[1]
+
+
+def write_catalogue(catalogue: Catalogue, cache: DiskCache = None):
+    use_cache = cache or get_default_cache()
+    with use_cache.writer(get_catalogue_key(), CATALOGUE_PACKAGES_CACHE_SUFFIX) as f:
+        catalogue.packages.write_ipc(f, compression="uncompressed")
+    with use_cache.writer(get_catalogue_key(), CATALOGUE_RESOURCES_CACHE_SUFFIX) as f:
+        catalogue.resources.write_ipc(f, compression="uncompressed")
+
+
+def sync_catalogue(
+    package_ids: list[str],
+    fetch_package_result: Callable[[str], Union[PackageShowModelResult, None]],
+    max_workers: int,
+    requests_per_second: float = DEFAULT_SYNC_REQUESTS_PER_SECOND,
+    max_age_in_seconds: float = 0,
+    cache: DiskCache = None,
+) -> Catalogue:
+    """Fetches package_show for every package id and persists the catalogue.
+
+    Packages in the previous snapshot that were synced less than max_age_in_seconds
+    ago are not fetched again, and only packages whose metadata_modified changed
+    replace their previous rows.
+    """
+    previous = read_catalogue(cache)
+    previous_metadata = previous.get_metadata_modified() if previous else {}
+    now = time.time()
+    stale_ids = [
+        package_id
+        for package_id in package_ids
+        if package_id not in previous_metadata
+        or now - previous_metadata[package_id][1] >= max_age_in_seconds
+    ]
+    logger.debug(f"Syncing {len(stale_ids)} of {len(package_ids)} package(s)")
+    if previous is not None and not stale_ids and len(previous) == len(package_ids):
+        return previous
+    rate_limiter = RateLimiter(requests_per_second)
+
+    def fetch(package_id: str) -> Union[PackageShowModelResult, None]:
+        rate_limiter.acquire()
+        try:
+            return fetch_package_result(package_id)
+        except Exception:
+            logger.exception(f"Unable to fetch package - {package_id}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = [
+            result for result in executor.map(fetch, stale_ids) if result is not None
+        ]
+    changed_results = [
+        result
+        for result in results
+        if (result.name or result.id) not in previous_metadata
+        or result.metadata_modified != previous_metadata[result.name or result.id][0]
+    ]
+    logger.debug(f"{len(changed_results)} package(s) changed since the last sync")
+
+    if previous is None:
+        catalogue = Catalogue.build(results, now)
+    else:
+        # unchanged packages only need a new synced_at
+        catalogue = previous.update(changed_results, package_ids, now)
+        synced_ids = [result.name or result.id for result in results]
+        catalogue.packages = catalogue.packages.with_columns(
+            pl.when(pl.col("package_id").is_in(synced_ids))
+            .then(pl.lit(now))
+            .otherwise(pl.col("synced_at"))
+            .alias("synced_at")
+        )
+    write_catalogue(catalogue, cache)
+    return catalogue
+
+
+def sync_catalogue_command():
+    from govtech_data import GovTechClient
+
+    catalogue = GovTechClient.sync_catalogue()
+    logger.info(
+        f"Catalogue has {len(catalogue)} package(s) and "
+        f"{len(catalogue.resources)} resource(s)"
+    )
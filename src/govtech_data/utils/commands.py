@@ -1,13 +1,29 @@
 import json
-from typing import Any
+import os
+from typing import Any, Callable, Union
 
+import polars as pl
+from loguru import logger
 from thefuzz import fuzz, process
 
 from govtech_data import GovTechClient
+from govtech_data.models.api import (
+    CatalogueSearchPackage,
+    DatasetProfile,
+    SearchPackage,
+)
 from govtech_data.models.resources.package_show import PackageShowModel
+from govtech_data.utils.cache import DataFrameCache
+from govtech_data.utils.profile import get_or_compute_profile
 
 NUMBER_OF_DATASETS_LIMIT = 50
 SEARCH_SCORE_THRESHOLD = 50
+CATALOGUE_SEARCH_LIMIT = 20
+DISTINCT_VALUES_TOKEN_BUDGET = int(
+    os.getenv("GOVTECH_DATA_DISTINCT_VALUES_TOKEN_BUDGET", 1000)
+)
+
+DATAFRAME_CACHE = DataFrameCache()
 
 
 def dataset_search(input_str: str) -> str:
@@ -15,21 +31,48 @@ def dataset_search(input_str: str) -> str:
 
 
 def dataset_search_batch(input_strs: list[str]) -> str:
-    dupes = {}
-    for input_str in input_strs:
-        for result in GovTechClient.search_package(input_str):
-            if result.package_id in dupes and dupes[result.package_id] >= result.score:
-                continue
-            if result.score <= SEARCH_SCORE_THRESHOLD:
-                continue
-            # results.append({"id": result.package_id, "score": result.score})
-            dupes[result.package_id] = result.score
-    results = sorted(
-        [{"id": k, "score": v} for k, v in dupes.items()],
-        key=lambda x: x.get("score"),
-        reverse=True,
-    )[:NUMBER_OF_DATASETS_LIMIT]
-    return f"Datasets found:\n\n" + json_dump(results)
+    return format_dataset_search_results(search_datasets(input_strs))
+
+
+def search_datasets(input_strs: list[str]) -> list[SearchPackage]:
+    return [
+        result
+        for result in GovTechClient.search_package_batch(input_strs)
+        if result.score > SEARCH_SCORE_THRESHOLD
+    ][:NUMBER_OF_DATASETS_LIMIT]
+
+
+def merge_search_results(*results: list[SearchPackage]) -> list[SearchPackage]:
+    """Keeps the best score of each package, the same as searching all inputs at once."""
+    best_results: dict[str, SearchPackage] = {}
+    for search_results in results:
+        for result in search_results:
+            best_result = best_results.get(result.package_id)
+            if best_result is None or result.score > best_result.score:
+                best_results[result.package_id] = result
+    return sorted(best_results.values(), key=lambda x: x.score, reverse=True)[
+        :NUMBER_OF_DATASETS_LIMIT
+    ]
+
+
+def format_dataset_search_results(results: list[SearchPackage]) -> str:
+    return f"Datasets found:\n\n" + json_dump(
+        [{"id": result.package_id, "score": result.score} for result in results]
+    )
+
+
+def search_catalogue_datasets(
+    input_str: str,
+) -> Union[list[CatalogueSearchPackage], None]:
+    return GovTechClient.search_catalogue(
+        input_str, limit=CATALOGUE_SEARCH_LIMIT, build=False
+    )
+
+
+def format_catalogue_search_results(results: list[CatalogueSearchPackage]) -> str:
+    return f"Datasets found:\n\n" + json_dump(
+        [{"id": i.package_id, "title": i.title, "score": i.score} for i in results]
+    )
 
 
 def get_dataset_metadata(package_id: str) -> str:
@@ -42,49 +85,161 @@ def get_dataset_metadata(package_id: str) -> str:
     )
 
 
+def get_dataframe_cache_key(package_id: str) -> Union[tuple, None]:
+    package_show: PackageShowModel = GovTechClient.package_show(package_id)
+    if package_show.result is None or not package_show.result.resources:
+        return None
+    resource = package_show.result.resources[0]
+    return package_id, resource.id, resource.hash, resource.last_modified
+
+
+def get_dataframe(package_id: str) -> Union[pl.DataFrame, None]:
+    key = get_dataframe_cache_key(package_id)
+    if key is None:
+        return None
+    return DATAFRAME_CACHE.get_or_load(
+        key, lambda: GovTechClient.fetch_dataframe_from_package(package_id)
+    )
+
+
+def get_value_counts(package_id: str, field_name: str) -> Union[pl.DataFrame, None]:
+    key = get_dataframe_cache_key(package_id)
+    if key is None:
+        return None
+
+    def load() -> Union[pl.DataFrame, None]:
+        df = get_dataframe(package_id)
+        if df is None:
+            return None
+        return df.groupby(field_name, maintain_order=True).count()
+
+    return DATAFRAME_CACHE.get_or_load(key + ("value_counts", field_name), load)
+
+
+def get_profile(package_id: str) -> Union[DatasetProfile, None]:
+    package_show: PackageShowModel = GovTechClient.package_show(package_id)
+    if package_show.result is None or not package_show.result.resources:
+        return None
+    return get_or_compute_profile(
+        package_show.result.resources[0], lambda: get_dataframe(package_id)
+    )
+
+
 def get_dataset_schema(package_id: str) -> str:
-    df = GovTechClient.fetch_dataframe_from_package(package_id)
-    if df is None:
+    profile = get_profile(package_id)
+    if profile is None:
         return ""
-    return f"Schema for {package_id}: " + str(df.schema)
+    return f"Schema for {package_id}: " + profile.get_schema_str()
 
 
 def get_all_distinct_values_and_counts_in_a_dataset_field(
     package_id: str, field_name: str
 ) -> list[(str, int)]:
-    df = GovTechClient.fetch_dataframe_from_package(package_id)
-    if df is None:
+    profile = get_profile(package_id)
+    if profile is None:
         return []
-    return [
-        (i.get(field_name), i.get("count"))
-        for i in df.groupby(field_name, maintain_order=True).count().to_dicts()
-    ]
+    column = profile.get_column(field_name)
+    if column is not None and column.value_counts is not None:
+        return [(value, count) for value, count in column.value_counts]
+    # high-cardinality columns are not kept in the profile
+    value_counts = get_value_counts(package_id, field_name)
+    if value_counts is None:
+        return []
+    return [(i.get(field_name), i.get("count")) for i in value_counts.to_dicts()]
 
 
-def get_all_distinct_values_in_a_dataset_field(package_id: str, field_name: str) -> str:
-    return f"All distinct values in {package_id}: {field_name}:\n\n" + json_dump(
-        [
-            i[0]
-            for i in get_all_distinct_values_and_counts_in_a_dataset_field(
-                package_id, field_name
-            )
-        ]
+def estimate_number_of_tokens(text: str) -> int:
+    # roughly 4 characters per token, used when no tokenizer is given
+    return len(text) // 4 + 1
+
+
+def parse_cursor(cursor: Union[str, int, None], number_of_values: int) -> int:
+    """Returns the start of the page, cursors come from the model and may be invalid."""
+    if cursor is None or cursor == "":
+        return 0
+    try:
+        start = int(cursor)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid cursor, starting from the first page - {cursor!r}")
+        return 0
+    return min(max(start, 0), number_of_values)
+
+
+def get_distinct_values_page(
+    package_id: str,
+    field_name: str,
+    cursor: Union[str, None] = None,
+    token_budget: int = DISTINCT_VALUES_TOKEN_BUDGET,
+    count_tokens: Callable[[str], int] = estimate_number_of_tokens,
+) -> dict:
+    """Returns the most frequent distinct values of a field that fit in token_budget.
+
+    The summary holds the number of distinct values, and next_cursor is set when there
+    are more values to page through.
+    """
+    value_counts = sorted(
+        get_all_distinct_values_and_counts_in_a_dataset_field(package_id, field_name),
+        key=lambda x: x[1],
+        reverse=True,
+    )
+    start = parse_cursor(cursor, len(value_counts))
+    page = {
+        "field": field_name,
+        "number_of_distinct_values": len(value_counts),
+        "number_of_rows": sum(count for _, count in value_counts),
+        "values_and_counts": [],
+        "next_cursor": None,
+    }
+    remaining_tokens = token_budget - count_tokens(json_dump(page))
+    end = start
+    while end < len(value_counts):
+        # +1 for the separating comma
+        number_of_tokens = count_tokens(json_dump(value_counts[end])) + 1
+        if number_of_tokens > remaining_tokens and end > start:
+            break
+        remaining_tokens -= number_of_tokens
+        end += 1
+    page["values_and_counts"] = [list(i) for i in value_counts[start:end]]
+    if end < len(value_counts):
+        page["next_cursor"] = str(end)
+    return page
+
+
+def get_all_distinct_values_in_a_dataset_field(
+    package_id: str,
+    field_name: str,
+    cursor: Union[str, None] = None,
+    token_budget: int = DISTINCT_VALUES_TOKEN_BUDGET,
+    count_tokens: Callable[[str], int] = estimate_number_of_tokens,
+) -> str:
+    page = get_distinct_values_page(
+        package_id, field_name, cursor, token_budget, count_tokens
+    )
+    return f"Most frequent distinct values in {package_id}: {field_name}:\n\n" + (
+        json_dump(page)
     )
 
 
 def search_for_relevant_values_in_a_dataset_field(
-    package_id: str, field_name: str, field_value: str
+    package_id: str,
+    field_name: str,
+    field_value: str,
+    cursor: Union[str, None] = None,
+    token_budget: int = DISTINCT_VALUES_TOKEN_BUDGET,
+    count_tokens: Callable[[str], int] = estimate_number_of_tokens,
 ) -> str:
+    if field_value is None or len(field_value) == 0:
+        return f"Most frequent unique values found in {field_name}:\n\n" + json_dump(
+            get_distinct_values_page(
+                package_id, field_name, cursor, token_budget, count_tokens
+            )
+        )
     unique_values = [
         i[0]
         for i in get_all_distinct_values_and_counts_in_a_dataset_field(
             package_id, field_name
         )
     ]
-    if field_value is None or len(field_value) == 0:
-        return f"All unique values found in {field_name}:\n\n" + json_dump(
-            [i[0] for i in unique_values]
-        )
     results = sorted(
         [
             {"value": n, "counts": s}
@@ -1,16 +1,80 @@
-from functools import lru_cache
-from io import StringIO
+import tempfile
+from typing import IO, Any, Callable
 
 import requests
 from loguru import logger
 
+from govtech_data.utils import metrics
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+from govtech_data.utils.http import get_session
 
-@lru_cache(maxsize=128)
-def fetch_url(url: str, params: dict = None) -> requests.Response:
-    use_session = requests.Session()
+DOWNLOAD_CHUNK_SIZE_IN_BYTES = 1024 * 1024
+# an entry can be evicted between its download and its open, it is fetched again
+CACHE_OPEN_ATTEMPTS = 3
+
+
+def fetch_url(url: str, params: dict = None, stream: bool = False) -> requests.Response:
+    use_session = get_session()
     logger.debug(f"Fetching url - {url}")
-    return use_session.get(url, params=params, timeout=30)
+    return use_session.get(url, params=params, timeout=30, stream=stream)
+
+
+def fetch_url_to_cache(url: str, version: Any = None, cache: DiskCache = None) -> str:
+    """Returns the path to a local copy of url, downloading it only on a cache miss.
+
+    version should change whenever the content behind url changes, e.g. the hash and
+    last_modified of a package_show resource. The entry can be evicted before the path
+    is opened, open_url_from_cache returns a handle instead.
+    """
+    use_cache = cache or get_default_cache()
+    key = get_cache_key(url, version)
+    path = use_cache.get(key)
+    metrics.record_cache("download", path is not None)
+    if path is not None:
+        logger.debug(f"Cache hit for url - {url}")
+        return path
+    with metrics.timer("govtech_data_download_duration_seconds"):
+        with fetch_url(url, stream=True) as resp:
+            if not resp.ok:
+                resp.raise_for_status()
+            with use_cache.writer(key) as f:
+                write_response_to_file(resp, f)
+    return use_cache.get_path(key)
+
+
+def open_url_from_cache(
+    url: str, version: Any = None, cache: DiskCache = None
+) -> IO[bytes]:
+    """Returns an open handle to a local copy of url, see fetch_url_to_cache.
+
+    Unlike the path, the handle stays readable if the entry is evicted.
+    """
+    return open_cached(lambda: fetch_url_to_cache(url, version, cache))
+
+
+def open_cached(fetch: Callable[[], str]) -> IO[bytes]:
+    """Opens the path returned by fetch, fetching it again if it was evicted."""
+    for _ in range(CACHE_OPEN_ATTEMPTS):
+        path = fetch()
+        try:
+            return convert_file_to_io(path)
+        except FileNotFoundError:
+            logger.debug(f"Cache entry was evicted before it was opened - {path}")
+    raise Exception(f"Cache entry was evicted before it was opened - {path}")
+
+
+def write_response_to_file(response: requests.Response, f: IO[bytes]):
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE_IN_BYTES):
+        f.write(chunk)
+        metrics.increment("govtech_data_downloaded_bytes_total", len(chunk))
+
+
+def convert_response_to_io(response: requests.Response) -> IO[bytes]:
+    f = tempfile.TemporaryFile()
+    write_response_to_file(response, f)
+    f.seek(0)
+    return f
 
 
-def convert_response_to_io(response: requests.Response) -> StringIO:
-    return StringIO(response.content.decode("utf-8"))
+def convert_file_to_io(path: str) -> IO[bytes]:
+    return open(path, "rb")
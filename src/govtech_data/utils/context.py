@@ -0,0 +1,189 @@
+from typing import Callable, Union
+
+from loguru import logger
+
+# the system prompt and the first request
+NUMBER_OF_LEADING_MESSAGES = 2
+
+PINNED_FUNCTIONS = frozenset(["get_dataset", "get_dataset_schema"])
+COMPRESSIBLE_FUNCTIONS = frozenset(
+    [
+        "dataset_search",
+        "get_all_distinct_values_in_a_dataset_field",
+        "search_for_relevant_values_in_a_dataset_field",
+    ]
+)
+COMPRESSED_MAX_CHARACTERS = 1000
+
+
+def get_message_sources(messages: list[dict]) -> list[Union[str, None]]:
+    """Returns the function each message belongs to, if any.
+
+    Function results are added as system messages right after the function message
+    that requested them, so they share its name.
+    """
+    sources = []
+    for i, message in enumerate(messages):
+        if message.get("role") == "function":
+            sources.append(message.get("name"))
+        elif (
+            message.get("role") == "system"
+            and i > 0
+            and messages[i - 1].get("role") == "function"
+        ):
+            sources.append(messages[i - 1].get("name"))
+        else:
+            sources.append(None)
+    return sources
+
+
+def is_function_result(messages: list[dict], i: int) -> bool:
+    """Whether message i is the result of the function call in message i - 1.
+
+    The result of an assistant function_call is a function message, the result of a
+    function message is the system message added right after it.
+    """
+    if i == 0:
+        return False
+    role, previous = messages[i].get("role"), messages[i - 1]
+    if previous.get("role") == "assistant" and previous.get("function_call"):
+        return role == "function"
+    return previous.get("role") == "function" and role == "system"
+
+
+def get_message_groups(messages: list[dict]) -> list[list[int]]:
+    """Groups the indices of messages so that a function call and its result are kept
+    or dropped together."""
+    groups = []
+    for i in range(len(messages)):
+        if groups and is_function_result(messages, i):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
+class ContextPackingStrategy:
+    """Chooses the messages that are sent when the history exceeds the token budget."""
+
+    def pack(
+        self,
+        messages: list[dict],
+        messages_tokens: list[int],
+        budget: int,
+        count_tokens: Callable[[dict], int],
+    ) -> list[dict]:
+        raise NotImplementedError
+
+
+class DropOldestStrategy(ContextPackingStrategy):
+    """Drops the oldest messages after the leading ones until the rest fit."""
+
+    def pack(
+        self,
+        messages: list[dict],
+        messages_tokens: list[int],
+        budget: int,
+        count_tokens: Callable[[dict], int],
+    ) -> list[dict]:
+        total_tokens = sum(messages_tokens)
+        end = NUMBER_OF_LEADING_MESSAGES
+        while total_tokens > budget and end < len(messages):
+            total_tokens -= messages_tokens[end]
+            end += 1
+        # the result of a dropped function call is dropped with it
+        while end < len(messages) - 1 and is_function_result(messages, end):
+            end += 1
+        return messages[:NUMBER_OF_LEADING_MESSAGES] + messages[end:]
+
+
+class PriorityPackingStrategy(ContextPackingStrategy):
+    """Keeps what the model needs to finish the task and drops what is cheapest to lose.
+
+    The leading messages, the latest message and the results of pinned functions,
+    e.g. the dataset schema and the chosen dataset id, are always kept. Older results
+    of compressible functions, e.g. lists of distinct values, are truncated first.
+    Then the remaining messages are dropped, most tokens first, until the rest fit.
+    Pinned messages are only dropped, oldest first, as a last resort. A function call
+    and its result are always kept or dropped together.
+    """
+
+    def __init__(
+        self,
+        pinned_functions: frozenset[str] = PINNED_FUNCTIONS,
+        compressible_functions: frozenset[str] = COMPRESSIBLE_FUNCTIONS,
+        compressed_max_characters: int = COMPRESSED_MAX_CHARACTERS,
+    ):
+        self.pinned_functions = pinned_functions
+        self.compressible_functions = compressible_functions
+        self.compressed_max_characters = compressed_max_characters
+
+    def compress(self, message: dict) -> dict:
+        content = message.get("content")
+        if (
+            not isinstance(content, str)
+            or len(content) <= self.compressed_max_characters
+        ):
+            return message
+        return {
+            **message,
+            "content": content[: self.compressed_max_characters]
+            + f"\n... ({len(content) - self.compressed_max_characters} more characters"
+            " truncated, call the function again for the full result)",
+        }
+
+    def pack(
+        self,
+        messages: list[dict],
+        messages_tokens: list[int],
+        budget: int,
+        count_tokens: Callable[[dict], int],
+    ) -> list[dict]:
+        messages = list(messages)
+        messages_tokens = list(messages_tokens)
+        total_tokens = sum(messages_tokens)
+        sources = get_message_sources(messages)
+        last = len(messages) - 1
+        protected = set(range(min(NUMBER_OF_LEADING_MESSAGES, len(messages)))) | {last}
+        groups = get_message_groups(messages)
+        # a call is protected along with its result and the other way round
+        protected = {i for group in groups if protected & set(group) for i in group}
+        pinned = {
+            i
+            for i, source in enumerate(sources)
+            if source in self.pinned_functions and i not in protected
+        }
+
+        for i, source in enumerate(sources):
+            if total_tokens <= budget:
+                break
+            if i in protected or source not in self.compressible_functions:
+                continue
+            compressed = self.compress(messages[i])
+            if compressed is not messages[i]:
+                compressed_tokens = count_tokens(compressed)
+                total_tokens -= messages_tokens[i] - compressed_tokens
+                messages[i], messages_tokens[i] = compressed, compressed_tokens
+
+        dropped = set()
+        droppable = sorted(
+            (group for group in groups if not (protected | pinned) & set(group)),
+            key=lambda group: (-sum(messages_tokens[i] for i in group), group[0]),
+        )
+        pinned_groups = [
+            group
+            for group in groups
+            if pinned & set(group) and not protected & set(group)
+        ]
+        for group in droppable + pinned_groups:
+            if total_tokens <= budget:
+                break
+            dropped.update(group)
+            total_tokens -= sum(messages_tokens[i] for i in group)
+        logger.debug(
+            f"Packed messages to {total_tokens} tokens, dropped {len(dropped)} messages"
+        )
+        return [message for i, message in enumerate(messages) if i not in dropped]
+
+
+DEFAULT_PACKING_STRATEGY = PriorityPackingStrategy()
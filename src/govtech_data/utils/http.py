@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_CONNECTIONS = int(os.getenv("GOVTECH_DATA_HTTP_POOL_CONNECTIONS", 10))
+DEFAULT_POOL_MAXSIZE = int(os.getenv("GOVTECH_DATA_HTTP_POOL_MAXSIZE", 10))
+DEFAULT_MAX_RETRIES = int(os.getenv("GOVTECH_DATA_HTTP_MAX_RETRIES", 3))
+DEFAULT_BACKOFF_FACTOR = float(os.getenv("GOVTECH_DATA_HTTP_BACKOFF_FACTOR", 0.5))
+
+RETRY_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+
+COMMON_SESSION_HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+
+def create_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    pool_maxsize_per_host: Union[dict[str, int], None] = None,
+) -> requests.Session:
+    """Returns a keep-alive session that retries GETs with backoff on 429 and 5xx.
+
+    pool_maxsize_per_host overrides pool_maxsize for specific hosts, e.g.
+    {"storage.data.gov.sg": 4}.
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_FORCELIST,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.headers.update(COMMON_SESSION_HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    for host, host_pool_maxsize in (pool_maxsize_per_host or {}).items():
+        host_adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=host_pool_maxsize, max_retries=retry
+        )
+        session.mount(f"https://{host}", host_adapter)
+        session.mount(f"http://{host}", host_adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def configure_session(**kwargs) -> requests.Session:
+    global _session
+    with _session_lock:
+        previous_session, _session = _session, create_session(**kwargs)
+    if previous_session is not None:
+        previous_session.close()
+    return _session
+
+
+class RateLimiter:
+    """Spaces out acquire calls from any number of threads to requests_per_second."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,173 @@
+import json
+import os
+from typing import Callable, Iterator, Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.models.api import IncrementalManifest
+from govtech_data.models.resources import package_show
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+
+INCREMENTAL_MANIFEST_CACHE_SUFFIX = ".incremental-manifest.json"
+INCREMENTAL_CHUNK_CACHE_SUFFIX = ".incremental-chunk.arrow"
+INCREMENTAL_MAX_CHUNKS = int(os.getenv("GOVTECH_DATA_INCREMENTAL_MAX_CHUNKS", 16))
+DATASTORE_ID_FIELD = "_id"
+
+
+def get_manifest_key(resource_id: str) -> str:
+    return get_cache_key("incremental-manifest", resource_id)
+
+
+def read_manifest(
+    resource_id: str, cache: DiskCache = None
+) -> Union[IncrementalManifest, None]:
+    use_cache = cache or get_default_cache()
+    path = use_cache.get(
+        get_manifest_key(resource_id), INCREMENTAL_MANIFEST_CACHE_SUFFIX
+    )
+    if path is None:
+        return None
+    try:
+        return IncrementalManifest.parse_file(path)
+    except (OSError, ValueError):
+        logger.exception(f"Unable to read incremental manifest - {path}")
+        return None
+
+
+def write_manifest(manifest: IncrementalManifest, cache: DiskCache = None):
+    use_cache = cache or get_default_cache()
+    with use_cache.writer(
+        get_manifest_key(manifest.resource_id), INCREMENTAL_MANIFEST_CACHE_SUFFIX
+    ) as f:
+        f.write(json.dumps(manifest.dict(), separators=(",", ":")).encode("utf-8"))
+
+
+def read_chunks(
+    manifest: IncrementalManifest, cache: DiskCache = None
+) -> Union[pl.DataFrame, None]:
+    use_cache = cache or get_default_cache()
+    paths = [
+        use_cache.get(key, INCREMENTAL_CHUNK_CACHE_SUFFIX) for key in manifest.chunks
+    ]
+    if not paths or None in paths:
+        # a chunk was evicted from the cache
+        return None
+    try:
+        return pl.concat(
+            [pl.read_ipc(path, memory_map=True) for path in paths], how="vertical"
+        )
+    except FileNotFoundError:
+        logger.debug(f"Incremental chunk was evicted - {manifest.resource_id}")
+        return None
+
+
+def write_chunk(
+    resource_id: str, start: int, df: pl.DataFrame, cache: DiskCache = None
+) -> str:
+    use_cache = cache or get_default_cache()
+    key = get_cache_key("incremental-chunk", resource_id, start, start + len(df))
+    with use_cache.writer(key, INCREMENTAL_CHUNK_CACHE_SUFFIX) as f:
+        df.write_ipc(f, compression="uncompressed")
+    return key
+
+
+def update_manifest(
+    previous: Union[IncrementalManifest, None],
+    manifest: IncrementalManifest,
+    cache: DiskCache = None,
+):
+    write_manifest(manifest, cache)
+    if previous is None:
+        return
+    # chunks are only removed once the new manifest no longer refers to them
+    use_cache = cache or get_default_cache()
+    for key in set(previous.chunks) - set(manifest.chunks):
+        use_cache.remove(key, INCREMENTAL_CHUNK_CACHE_SUFFIX)
+
+
+def get_last_id(df: pl.DataFrame) -> Union[int, None]:
+    if DATASTORE_ID_FIELD not in df.columns or len(df) == 0:
+        return None
+    return df[DATASTORE_ID_FIELD][-1]
+
+
+def refresh_resource_dataframe(
+    resource: package_show.Resource,
+    fetch_total: Callable[[], int],
+    iter_dataframes: Callable[[int], Iterator[pl.DataFrame]],
+    cache: DiskCache = None,
+) -> pl.DataFrame:
+    """Returns the datastore rows of resource, fetching only rows added since the last
+    refresh.
+
+    Rows are ordered by _id. When the row count has not shrunk and the last cached row
+    still has the same _id, the rows from the previous total onwards are appended as a
+    new chunk, otherwise every row is fetched again.
+    """
+    manifest = read_manifest(resource.id, cache)
+    df = read_chunks(manifest, cache) if manifest is not None else None
+    if df is not None and (manifest.hash, manifest.last_modified) == (
+        resource.hash,
+        resource.last_modified,
+    ):
+        return df
+
+    if df is not None and manifest.last_id is not None:
+        total = fetch_total()
+        if total >= manifest.total:
+            tail_dfs = list(iter_dataframes(manifest.total - 1))
+            tail_df = (
+                pl.concat(tail_dfs, how="diagonal") if tail_dfs else pl.DataFrame()
+            )
+            if (
+                len(tail_df) > 0
+                and tail_df[DATASTORE_ID_FIELD][0] == manifest.last_id
+                and set(tail_df.columns) == set(df.columns)
+            ):
+                tail_df = tail_df.slice(1).select(
+                    [pl.col(name).cast(dtype) for name, dtype in df.schema.items()]
+                )
+                logger.debug(
+                    f"Appending {len(tail_df)} new row(s) to resource - {resource.id}"
+                )
+                chunks = manifest.chunks
+                if len(tail_df) > 0:
+                    chunks = chunks + [
+                        write_chunk(resource.id, manifest.total, tail_df, cache)
+                    ]
+                    df = pl.concat([df, tail_df], how="vertical")
+                if len(chunks) > INCREMENTAL_MAX_CHUNKS:
+                    chunks = [write_chunk(resource.id, 0, df, cache)]
+                update_manifest(
+                    manifest,
+                    IncrementalManifest(
+                        resource_id=resource.id,
+                        hash=resource.hash,
+                        last_modified=resource.last_modified,
+                        total=manifest.total + len(tail_df),
+                        last_id=get_last_id(df),
+                        chunks=chunks,
+                    ),
+                    cache,
+                )
+                return df
+        logger.debug(
+            f"Cached rows changed, fetching all rows of resource - {resource.id}"
+        )
+
+    dfs = list(iter_dataframes(0))
+    df = pl.concat(dfs, how="diagonal") if dfs else pl.DataFrame()
+    update_manifest(
+        manifest,
+        IncrementalManifest(
+            resource_id=resource.id,
+            hash=resource.hash,
+            last_modified=resource.last_modified,
+            total=len(df),
+            last_id=get_last_id(df),
+            chunks=[write_chunk(resource.id, 0, df, cache)],
+        ),
+        cache,
+    )
+    return df
@@ -0,0 +1,95 @@
+import os
+from enum import Enum
+from typing import Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.models.resources import package_show
+from govtech_data.utils import metrics
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+
+
+class MaterializeFormat(str, Enum):
+    IPC = "ipc"
+    PARQUET = "parquet"
+
+
+MATERIALIZE_FORMAT = os.getenv("GOVTECH_DATA_MATERIALIZE_FORMAT") or None
+
+MATERIALIZE_SUFFIXES = {
+    MaterializeFormat.IPC: ".arrow",
+    MaterializeFormat.PARQUET: ".parquet",
+}
+
+
+def get_materialized_key(resource: package_show.Resource) -> str:
+    return get_cache_key(
+        "materialized", resource.id, resource.hash, resource.last_modified
+    )
+
+
+def get_materialized_path(
+    resource: package_show.Resource,
+    materialize: Union[MaterializeFormat, str],
+    cache: DiskCache = None,
+) -> Union[str, None]:
+    materialize = MaterializeFormat(materialize)
+    use_cache = cache or get_default_cache()
+    return use_cache.get(
+        get_materialized_key(resource), MATERIALIZE_SUFFIXES[materialize]
+    )
+
+
+def read_materialized(
+    resource: package_show.Resource,
+    materialize: Union[MaterializeFormat, str],
+    cache: DiskCache = None,
+) -> Union[pl.DataFrame, None]:
+    materialize = MaterializeFormat(materialize)
+    path = get_materialized_path(resource, materialize, cache)
+    metrics.record_cache("materialized", path is not None)
+    if path is None:
+        return None
+    logger.debug(
+        f"Reading materialized {materialize.value} for resource - {resource.id}"
+    )
+    try:
+        if materialize == MaterializeFormat.IPC:
+            return pl.read_ipc(path, memory_map=True)
+        return pl.read_parquet(path, memory_map=True)
+    except FileNotFoundError:
+        logger.debug(f"Materialized file was evicted - {path}")
+        return None
+
+
+def write_materialized(
+    resource: package_show.Resource,
+    df: pl.DataFrame,
+    materialize: Union[MaterializeFormat, str],
+    cache: DiskCache = None,
+) -> str:
+    materialize = MaterializeFormat(materialize)
+    use_cache = cache or get_default_cache()
+    key, suffix = get_materialized_key(resource), MATERIALIZE_SUFFIXES[materialize]
+    with use_cache.writer(key, suffix) as f:
+        if materialize == MaterializeFormat.IPC:
+            # uncompressed so that it can be memory-mapped on read
+            df.write_ipc(f, compression="uncompressed")
+        else:
+            df.write_parquet(f)
+    return use_cache.get_path(key, suffix)
+
+
+def scan_materialized(
+    resource: package_show.Resource,
+    materialize: Union[MaterializeFormat, str],
+    cache: DiskCache = None,
+) -> Union[pl.LazyFrame, None]:
+    materialize = MaterializeFormat(materialize)
+    path = get_materialized_path(resource, materialize, cache)
+    if path is None:
+        return None
+    if materialize == MaterializeFormat.IPC:
+        return pl.scan_ipc(path, memory_map=True)
+    return pl.scan_parquet(path)
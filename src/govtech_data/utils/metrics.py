@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Union
+
+DEFAULT_DURATION_BUCKETS_IN_SECONDS = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class MetricsRecorder:
+    """Receives counters and observations from the library, ignores them by default.
+
+    Subclass it and pass an instance to set_recorder to export the metrics elsewhere.
+    """
+
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        pass
+
+    def observe(self, name: str, value: float, **labels: str):
+        pass
+
+
+class InMemoryRecorder(MetricsRecorder):
+    """Keeps counters and histograms in memory and renders them as Prometheus text."""
+
+    enabled = True
+
+    def __init__(
+        self, buckets: tuple[float, ...] = DEFAULT_DURATION_BUCKETS_IN_SECONDS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        # (name, labels) -> value
+        self.counters: dict[tuple[str, tuple], float] = {}
+        # (name, labels) -> [count, sum, bucket counts]
+        self.histograms: dict[tuple[str, tuple], list] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0, 0.0, [0] * len(self.buckets)]
+            histogram[0] += 1
+            histogram[1] += value
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[2][index] += 1
+
+    def get_counter(self, name: str, **labels: str) -> float:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name: str, **labels: str) -> Union[dict, None]:
+        histogram = self.histograms.get((name, tuple(sorted(labels.items()))))
+        if histogram is None:
+            return None
+        return {"count": histogram[0], "sum": histogram[1]}
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), (count, total, bucket_counts) in sorted(
+                self.histograms.items()
+            ):
+                cumulative = 0
+                for bucket, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels = format_labels(labels + (("le", str(bucket)),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = format_labels(labels + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in labels) + "}"
+
+
+_recorder = MetricsRecorder()
+
+
+def get_recorder() -> MetricsRecorder:
+    return _recorder
+
+
+def set_recorder(recorder: Union[MetricsRecorder, None]) -> MetricsRecorder:
+    global _recorder
+    _recorder = recorder or MetricsRecorder()
+    return _recorder
+
+
+def increment(name: str, value: float = 1, **labels: str):
+    if _recorder.enabled:
+        _recorder.increment(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: str):
+    if _recorder.enabled:
+        _recorder.observe(name, value, **labels)
+
+
+def record_cache(cache: str, hit: bool):
+    if _recorder.enabled:
+        _recorder.increment(
+            "govtech_data_cache_requests_total",
+            cache=cache,
+            result="hit" if hit else "miss",
+        )
+
+
+@contextmanager
+def _timer(name: str, labels: dict) -> Iterator[dict]:
+    # labels can still be added inside the block, e.g. the status of a response
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        _recorder.observe(name, time.perf_counter() - start, **labels)
+
+
+def timer(name: str, **labels: str):
+    """Observes the duration of the block in seconds, a no-op unless a recorder is set."""
+    if not _recorder.enabled:
+        # labels is a new dict per call, so callers can add to it without sharing state
+        return nullcontext(labels)
+    return _timer(name, labels)
@@ -1,10 +1,15 @@
 import json
+import threading
+from functools import lru_cache
+from typing import Callable, Optional
 
 import tiktoken
 
 from govtech_data.models import gptactions
-from govtech_data.prompts.task import TASK_SYSTEM_PROMPT, KEYWORD_SUGGESTION_PROMPT
-from govtech_data.utils import commands
+from govtech_data.prompts.task import TASK_SYSTEM_PROMPT
+from govtech_data.utils import commands, metrics
+from govtech_data.utils.agent import DEFAULT_MAX_STEPS, DEFAULT_TOOL_REGISTRY, Agent, AgentHooks, ToolRegistry
+from govtech_data.utils.context import DEFAULT_PACKING_STRATEGY, ContextPackingStrategy
 
 try:
     import openai
@@ -40,6 +45,42 @@ MODEL_CONFIGS = {
     "gpt-3.5-turbo-16k": {MAXIMUM_NUMBER_OF_TOKENS_KEY: 16000 - TOKEN_BUFFER},
 }
 
+REPLY_PRIMING_TOKENS = 3  # every reply is primed with <|start|>assistant<|message|>
+_functions_tokens_cache: dict[tuple[int, str], tuple[list[dict], int]] = {}
+_tokens_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warning("Warning: model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=None)
+def get_token_counting_config(model: str) -> tuple[str, int, int]:
+    """Returns the model whose tokens are counted, the tokens per message and the tokens per name."""
+    if model in ("gpt-3.5-turbo"):
+        logger.warning("Warning: gpt-3.5-turbo may change over time. Returning num tokens assuming gpt-3.5-turbo-0613.")
+        return get_token_counting_config("gpt-3.5-turbo-0613")
+    elif model == "gpt-4":
+        logger.warning("Warning: gpt-4 may change over time. Returning num tokens assuming gpt-4-0613.")
+        return get_token_counting_config("gpt-4-0613")
+    elif model in (
+        "gpt-3.5-turbo-0301",
+        "gpt-3.5-turbo-0613",
+        "gpt-3.5-turbo-16k-0613",
+    ):
+        # every message follows <|start|>{role/name}\n{content}<|end|>\n, if there's a name, the role is omitted
+        return model, 4, -1
+    elif model in ("gpt-4-0314", "gpt-4-0613"):
+        return model, 3, 1
+    raise NotImplementedError(
+        f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
+    )
+
 
 class OpenAIClient:
     _instance = None
@@ -52,8 +93,17 @@ class OpenAIClient:
     def __init__(self):
         super().__init__()
         self.messages_history: list[dict[str, str]] = []
+        # token counts of messages_history for messages_tokens_model
+        self.messages_tokens: list[int] = []
+        self.messages_total_tokens = 0
+        self.messages_tokens_model = OPENAI_DEFAULT_MODEL
         self.last_response = None
-        self.CIRCUIT_BREAKER_LIMIT = 15
+        self.packing_strategy: ContextPackingStrategy = DEFAULT_PACKING_STRATEGY
+        self.tool_registry: ToolRegistry = DEFAULT_TOOL_REGISTRY
+        self.agent_hooks: list[AgentHooks] = []
+        # the agent of the last query, call agent.cancel() to stop it from another thread
+        self.agent: Optional[Agent] = None
+        self.CIRCUIT_BREAKER_LIMIT = DEFAULT_MAX_STEPS
 
     def query(
         self,
@@ -64,183 +114,16 @@ class OpenAIClient:
         task_system_prompt=TASK_SYSTEM_PROMPT,
         role="user",
     ):
-        if depth >= self.CIRCUIT_BREAKER_LIMIT:
-            logger.error("circuit-breaker triggered to avoid an infinite query loop")
-            return False
-
-        if len(self.messages_history) == 0:
-            self.messages_history.append(self.get_message("system", task_system_prompt))
-
-        if query:
-            message = self.get_message(role, query)
-            logger.debug(f"Request:\n{message}")
-            self.messages_history.append(message)
-
-        responses = self.simple_query_openai(self.messages_history, functions=functions, model=model, n=1)
-
-        if len(responses) == 0:
-            return False
-
-        raw_response = responses[0]
-
-        self.last_response = raw_response
-
-        try:
-            finish_reason = raw_response.get("finish_reason", None)
-            if finish_reason == "function_call":
-                response = raw_response["message"]["function_call"]
-                name, args = response["name"], json.loads(response["arguments"])
-            else:
-                response = raw_response["message"]
-                self.messages_history.append(self.get_message("assistant", commands.json_dump(response)))
-                return self.query(
-                    "Please return a function call",
-                    functions=functions,
-                    model=model,
-                    depth=depth + 1,
-                    task_system_prompt=task_system_prompt,
-                    role="system",
-                )
-
-            logger.debug(f"ChatGPT content response:\n{response}")
-            self.messages_history.append(self.get_function_message(name, commands.json_dump(args)))
-        except:
-            logger.exception(f"response cannot be parsed! ChatGPT content response:\n{raw_response}")
-            self.messages_history.append(self.get_message("assistant", commands.json_dump(raw_response)))
-            return self.query(
-                None,
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-            )
-
-        if name == "dataset_search":
-            ss_messages = [
-                self.get_message("system", KEYWORD_SUGGESTION_PROMPT),
-                # self.get_message("function", commands.json_dump(response)),
-                self.get_function_message(
-                    response["name"],
-                    commands.json_dump(json.loads(response["arguments"])),
-                ),
-                self.get_message("user", args.get("input")),
-            ]
-            # logger.info(f"ss_messages: {ss_messages}")
-            ss_responses = self.simple_query_openai(
-                ss_messages,
-                functions=gptactions.KEYWORD_PHRASES_FUNCTION,
-                model=model,
-                temperature=0.7,
-                n=1,
-            )
-
-            ss_raw_response = ss_responses[0]
-
-            try:
-                ss_finish_reason = ss_raw_response.get("finish_reason", None)
-                if ss_finish_reason == "function_call":
-                    ss_response = ss_raw_response["message"]["function_call"]
-                    ss_name, ss_args = ss_response["name"], json.loads(ss_response["arguments"])
-                    logger.debug(f"ChatGPT ss_response_data:\n{ss_response}")
-                    ss_thoughts, ss_phrases = ss_args.get("current_thoughts", {}).get("thoughts"), ss_args.get(
-                        "phrases", []
-                    )
-                    return self.query(
-                        commands.dataset_search_batch([args.get("input")] + ss_phrases),
-                        functions=functions,
-                        model=model,
-                        depth=depth + 1,
-                        task_system_prompt=task_system_prompt,
-                        role="system",
-                    )
-
-            except:
-                logger.exception(f"response cannot be parsed! ChatGPT content response:\n{ss_responses}")
-                self.messages_history.append(self.get_message("assistant", ss_response))
-                return self.query(
-                    None,
-                    functions=functions,
-                    model=model,
-                    depth=depth + 1,
-                    task_system_prompt=task_system_prompt,
-                )
-
-        elif name == "get_dataset":
-            return self.query(
-                commands.get_dataset_schema(args.get("id")),
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "get_dataset_schema":
-            return self.query(
-                commands.get_dataset_schema(args.get("id")),
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "get_all_distinct_values_in_a_dataset_field":
-            return self.query(
-                commands.get_all_distinct_values_in_a_dataset_field(args.get("id"), args.get("field")),
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "search_for_relevant_values_in_a_dataset_field":
-            return self.query(
-                commands.search_for_relevant_values_in_a_dataset_field(
-                    args.get("id"), args.get("field"), args.get("value")
-                ),
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "do_nothing":
-            return self.query(
-                None,
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "generate_full_code":
-            return self.query(
-                "Fix and optimize the following code",
-                functions=functions,
-                model=model,
-                depth=depth + 1,
-                task_system_prompt=task_system_prompt,
-                role="system",
-            )
-
-        elif name == "generate_optimized_code":
-            return True
-
-        elif name == "task_complete":
-            return True
-
-        return self.query(
-            None,
+        self.agent = Agent(
+            self,
+            model,
+            registry=self.tool_registry,
+            hooks=self.agent_hooks,
             functions=functions,
-            model=model,
-            depth=depth + 1,
             task_system_prompt=task_system_prompt,
-            role="system",
+            max_steps=self.CIRCUIT_BREAKER_LIMIT,
         )
+        return self.agent.run(query, role=role, first_step=depth)
 
     def query_plot(
         self,
@@ -280,16 +163,32 @@ class OpenAIClient:
         return generated_code
 
     def messages_add(self, message: dict[str, str]):
+        num_tokens = self.num_tokens_from_message(message, self.messages_tokens_model)
         self.messages_history.append(message)
+        self.messages_tokens.append(num_tokens)
+        self.messages_total_tokens += num_tokens
 
     def messages_length(self):
         return len(self.messages_history)
 
     def messages_num_tokens(self, model=OPENAI_DEFAULT_MODEL):
-        return self.num_tokens_from_messages(self.messages_history, model)
+        self.get_messages_tokens(model)
+        return self.messages_total_tokens + REPLY_PRIMING_TOKENS
+
+    def get_messages_tokens(self, model=OPENAI_DEFAULT_MODEL) -> list[int]:
+        """Returns the token counts of messages_history, they are only recounted when the model counts differently."""
+        if get_token_counting_config(model) != get_token_counting_config(self.messages_tokens_model) or len(
+            self.messages_tokens
+        ) != len(self.messages_history):
+            self.messages_tokens = [self.num_tokens_from_message(message, model) for message in self.messages_history]
+            self.messages_total_tokens = sum(self.messages_tokens)
+            self.messages_tokens_model = model
+        return self.messages_tokens
 
     def messages_clear(self):
         self.messages_history = []
+        self.messages_tokens = []
+        self.messages_total_tokens = 0
 
     def print_message_history(self):
         for i, message in enumerate(self.messages_history):
@@ -298,43 +197,39 @@ class OpenAIClient:
     @classmethod
     def num_tokens_from_messages(cls, messages, model=OPENAI_DEFAULT_MODEL):
         """Returns the number of tokens used by a list of messages. - taken from openai-cookbook"""
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            logger.warning("Warning: model not found. Using cl100k_base encoding.")
-            encoding = tiktoken.get_encoding("cl100k_base")
-        if model in ("gpt-3.5-turbo"):
-            logger.warning(
-                "Warning: gpt-3.5-turbo may change over time. Returning num tokens assuming gpt-3.5-turbo-0613."
-            )
-            return cls.num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613")
-        elif model == "gpt-4":
-            logger.warning("Warning: gpt-4 may change over time. Returning num tokens assuming gpt-4-0613.")
-            return cls.num_tokens_from_messages(messages, model="gpt-4-0613")
-        elif model in (
-            "gpt-3.5-turbo-0301",
-            "gpt-3.5-turbo-0613",
-            "gpt-3.5-turbo-16k-0613",
-        ):
-            tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-            tokens_per_name = -1  # if there's a name, the role is omitted
-        elif model in ("gpt-4-0314", "gpt-4-0613"):
-            tokens_per_message = 3
-            tokens_per_name = 1
-        else:
-            raise NotImplementedError(
-                f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
-            )
-        num_tokens = 0
-        for message in messages:
-            num_tokens += tokens_per_message
-            for key, value in message.items():
-                if not isinstance(value, str):
-                    value = commands.json_dump(value)
-                num_tokens += len(encoding.encode(value))
-                if key == "name":
-                    num_tokens += tokens_per_name
-        num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+        return sum(cls.num_tokens_from_message(message, model) for message in messages) + REPLY_PRIMING_TOKENS
+
+    @classmethod
+    def num_tokens_from_message(cls, message: dict, model=OPENAI_DEFAULT_MODEL) -> int:
+        """Returns the number of tokens used by a message."""
+        counting_model, tokens_per_message, tokens_per_name = get_token_counting_config(model)
+        items = tuple(
+            (key, value if isinstance(value, str) else commands.json_dump(value)) for key, value in message.items()
+        )
+        encoding = get_encoding(counting_model)
+        num_tokens = tokens_per_message
+        for item_key, value in items:
+            num_tokens += len(encoding.encode(value))
+            if item_key == "name":
+                num_tokens += tokens_per_name
+        return num_tokens
+
+    @classmethod
+    def get_text_tokens_counter(cls, model=OPENAI_DEFAULT_MODEL) -> Callable[[str], int]:
+        """Returns a function that counts the tokens of a text with the model's tokenizer."""
+        encoding = get_encoding(get_token_counting_config(model)[0])
+        return lambda text: len(encoding.encode(text))
+
+    @classmethod
+    def num_tokens_from_functions(cls, functions: list[dict], model=OPENAI_DEFAULT_MODEL) -> int:
+        # function definitions are module constants, so they are cached by identity
+        key = (id(functions), model)
+        cached = _functions_tokens_cache.get(key)
+        if cached is not None and cached[0] is functions:
+            return cached[1]
+        num_tokens = sum(cls.num_tokens_from_message(function, model) for function in functions)
+        with _tokens_cache_lock:
+            _functions_tokens_cache[key] = (functions, num_tokens)
         return num_tokens
 
     @classmethod
@@ -345,27 +240,57 @@ class OpenAIClient:
         model=OPENAI_DEFAULT_MODEL,
         temperature=OPENAI_DEFAULT_TEMPERATURE,
         n=1,
+        step: str = "query",
+        packing_strategy: ContextPackingStrategy = DEFAULT_PACKING_STRATEGY,
+        usage: dict = None,
+        messages_tokens: list[int] = None,
     ) -> list[str]:
+        """Returns the choices of a chat completion, the token usage is added to usage when given.
+
+        messages_tokens are the token counts of messages when they are already known, e.g. from get_messages_tokens.
+        """
         use_messages = messages.copy()
         if n == 1:
             logger.debug(f"functions: \n{functions}")
         logger.debug(f"use_messages: \n{use_messages}")
-        total_tokens = cls.num_tokens_from_messages(use_messages + functions, model)
+        if messages_tokens is None:
+            messages_tokens = [cls.num_tokens_from_message(message, model) for message in use_messages]
+        total_tokens = sum(messages_tokens) + cls.num_tokens_from_functions(functions, model) + REPLY_PRIMING_TOKENS
         logger.debug(f"Total number of tokens in messages: {total_tokens}")
-        if total_tokens >= MODEL_CONFIGS.get(model, {}).get(
+        maximum_number_of_tokens = MODEL_CONFIGS.get(model, {}).get(
             MAXIMUM_NUMBER_OF_TOKENS_KEY,
             OPENAI_DEFAULT_MAX_NUMBER_OF_TOKENS - TOKEN_BUFFER,
-        ):
-            logger.debug(f"  Need to remove an entry from the list of messages to reduce the number of tokens")
-            while total_tokens >= MODEL_CONFIGS.get(model, {}).get(
-                MAXIMUM_NUMBER_OF_TOKENS_KEY,
-                OPENAI_DEFAULT_MAX_NUMBER_OF_TOKENS - TOKEN_BUFFER,
-            ):
-                del use_messages[2]
-                total_tokens = cls.num_tokens_from_messages(use_messages + functions, model)
-                logger.debug(f"  Total number of tokens in messages remaining: {total_tokens}")
-
-        completion = cls.__query_openai(use_messages, functions, model, temperature, n)
+        )
+        if total_tokens >= maximum_number_of_tokens:
+            logger.debug(f"  Need to pack the list of messages to reduce the number of tokens")
+            other_tokens = total_tokens - sum(messages_tokens)
+            use_messages = packing_strategy.pack(
+                use_messages,
+                messages_tokens,
+                maximum_number_of_tokens - 1 - other_tokens,
+                lambda message: cls.num_tokens_from_message(message, model),
+            )
+            # only messages changed by the packing strategy are counted again
+            known_tokens = {id(message): num_tokens for message, num_tokens in zip(messages, messages_tokens)}
+            total_tokens = other_tokens + sum(
+                (
+                    known_tokens[id(message)]
+                    if id(message) in known_tokens
+                    else cls.num_tokens_from_message(message, model)
+                )
+                for message in use_messages
+            )
+            logger.debug(f"  Total number of tokens in messages remaining: {total_tokens}")
+
+        metrics.increment("govtech_data_llm_prompt_tokens_total", total_tokens, model=model, step=step)
+        with metrics.timer("govtech_data_llm_request_duration_seconds", model=model, step=step):
+            completion = cls.__query_openai(use_messages, functions, model, temperature, n)
+        completion_tokens = (completion.get("usage") or {}).get("completion_tokens", 0)
+        if completion_tokens:
+            metrics.increment("govtech_data_llm_completion_tokens_total", completion_tokens, model=model, step=step)
+        if usage is not None:
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + total_tokens
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
         responses = []
         logger.debug(f"ChatGPT Completion Response:\n{completion}")
         for choice in completion.choices:
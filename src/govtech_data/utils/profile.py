@@ -0,0 +1,99 @@
+import json
+import os
+from typing import Any, Callable, Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.models.api import ColumnProfile, DatasetProfile
+from govtech_data.models.resources import package_show
+from govtech_data.utils import metrics
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+
+PROFILE_VALUE_COUNTS_LIMIT = int(
+    os.getenv("GOVTECH_DATA_PROFILE_VALUE_COUNTS_LIMIT", 1000)
+)
+PROFILE_CACHE_SUFFIX = ".profile.json"
+
+
+def to_json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def compute_column_profile(series: pl.Series) -> ColumnProfile:
+    n_unique = series.n_unique()
+    value_counts = None
+    if n_unique <= PROFILE_VALUE_COUNTS_LIMIT:
+        value_counts = [
+            (to_json_value(value), count)
+            for value, count in series.to_frame()
+            .groupby(series.name, maintain_order=True)
+            .count()
+            .rows()
+        ]
+    try:
+        minimum, maximum = series.min(), series.max()
+    except Exception:
+        minimum, maximum = None, None
+    return ColumnProfile(
+        name=series.name,
+        dtype=str(series.dtype),
+        null_count=series.null_count(),
+        n_unique=n_unique,
+        min=to_json_value(minimum),
+        max=to_json_value(maximum),
+        value_counts=value_counts,
+    )
+
+
+def compute_profile(df: pl.DataFrame) -> DatasetProfile:
+    return DatasetProfile(
+        row_count=df.height,
+        columns=[compute_column_profile(df[column]) for column in df.columns],
+    )
+
+
+def get_profile_key(resource: package_show.Resource) -> str:
+    return get_cache_key("profile", resource.id, resource.hash, resource.last_modified)
+
+
+def read_profile(
+    resource: package_show.Resource, cache: DiskCache = None
+) -> Union[DatasetProfile, None]:
+    use_cache = cache or get_default_cache()
+    path = use_cache.get(get_profile_key(resource), PROFILE_CACHE_SUFFIX)
+    metrics.record_cache("profile", path is not None)
+    if path is None:
+        return None
+    try:
+        return DatasetProfile.parse_file(path)
+    except (OSError, ValueError):
+        logger.exception(f"Unable to read profile - {path}")
+        return None
+
+
+def write_profile(
+    resource: package_show.Resource, profile: DatasetProfile, cache: DiskCache = None
+):
+    use_cache = cache or get_default_cache()
+    with use_cache.writer(get_profile_key(resource), PROFILE_CACHE_SUFFIX) as f:
+        f.write(json.dumps(profile.dict(), separators=(",", ":")).encode("utf-8"))
+
+
+def get_or_compute_profile(
+    resource: package_show.Resource,
+    load_dataframe: Callable[[], Union[pl.DataFrame, None]],
+    cache: DiskCache = None,
+) -> Union[DatasetProfile, None]:
+    profile = read_profile(resource, cache)
+    if profile is not None:
+        return profile
+    df = load_dataframe()
+    if df is None:
+        return None
+    logger.debug(f"Profiling resource - {resource.id}")
+    profile = compute_profile(df)
+    write_profile(resource, profile, cache)
+    return profile
@@ -0,0 +1,352 @@
+import json
+import os
+import re
+from enum import Enum
+from typing import IO, Union
+
+import polars as pl
+from loguru import logger
+
+from govtech_data.models.resources import package_show
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+
+
+class SchemaInference(str, Enum):
+    # infer from every row, which needs a full extra pass over the file
+    FULL = "full"
+    # infer from the first rows, then verify the cast of every column
+    SAMPLE = "sample"
+    # use the field types published in package_show, then verify the cast of every column
+    METADATA = "metadata"
+
+
+SCHEMA_INFERENCE = os.getenv("GOVTECH_DATA_SCHEMA_INFERENCE", SchemaInference.FULL)
+SCHEMA_INFERENCE_SAMPLE_SIZE = int(
+    os.getenv("GOVTECH_DATA_SCHEMA_INFERENCE_SAMPLE_SIZE", 10000)
+)
+
+CSV_OPTIONS = {"quote_char": None}
+SCHEMA_CACHE_SUFFIX = ".schema.json"
+
+
+def get_dtype_from_field(field: package_show.Field) -> Union[pl.PolarsDataType, None]:
+    field_type = (field.type or "").lower()
+    detected_types = (field.detected_types or "").lower()
+    sub_type = (field.sub_type or "").lower()
+    if field_type == "numeric":
+        if "integer" in (sub_type, detected_types):
+            return pl.Int64
+        return pl.Float64
+    if field_type == "text":
+        return pl.Utf8
+    # datetime and other types are kept as strings to avoid guessing their format
+    return None
+
+
+def get_schema_from_resource(
+    resource: package_show.Resource,
+) -> dict[str, pl.PolarsDataType]:
+    schema = {}
+    for field in resource.fields or []:
+        dtype = get_dtype_from_field(field)
+        if field.name and dtype is not None:
+            schema[field.name] = dtype
+    return schema
+
+
+FALLBACK_DTYPES = [pl.Int64, pl.Float64]
+
+
+def get_cast_expr(name: str, dtype: pl.PolarsDataType) -> pl.Expr:
+    if dtype == pl.Boolean:
+        value = pl.col(name).str.to_lowercase()
+        return (
+            pl.when(value == "true")
+            .then(True)
+            .when(value == "false")
+            .then(False)
+            .otherwise(None)
+            .alias(name)
+        )
+    return pl.col(name).cast(dtype, strict=False)
+
+
+def cast_columns_verified(
+    df: pl.DataFrame, schema: dict[str, pl.PolarsDataType]
+) -> tuple[pl.DataFrame, list[str]]:
+    """Casts string columns to the schema, returns the columns that failed to cast.
+
+    A cast that turns values into nulls means the column does not match the schema,
+    such columns are left as strings.
+    """
+    cast_columns = [name for name in df.columns if schema.get(name, pl.Utf8) != pl.Utf8]
+    if not cast_columns:
+        return df, []
+    cast_df = df.select([get_cast_expr(name, schema[name]) for name in cast_columns])
+    null_counts = df.select(cast_columns).null_count().row(0)
+    cast_null_counts = cast_df.null_count().row(0)
+    failed_columns = [
+        name
+        for name, null_count, cast_null_count in zip(
+            cast_columns, null_counts, cast_null_counts
+        )
+        if cast_null_count > null_count
+    ]
+    df = df.with_columns(
+        [cast_df[name] for name in cast_columns if name not in failed_columns]
+    )
+    return df, failed_columns
+
+
+# ISO 8601 values that pyarrow, which reads the full mode, parses into dates
+ISO_TEMPORAL_FORMATS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), pl.Date, "%Y-%m-%d"),
+    (
+        re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}"),
+        pl.Datetime("ms"),
+        "%Y-%m-%d %H:%M:%S",
+    ),
+]
+ISO_TEMPORAL_DETECTION_ROWS = 100
+
+
+def get_csv_source(source: IO[bytes]) -> Union[str, IO[bytes]]:
+    # polars reads a path without copying it through python, and warns when given a
+    # handle to a file on disk. /proc/self/fd names the open file itself, which stays
+    # readable when the cache evicts its path
+    try:
+        fd_path = f"/proc/self/fd/{source.fileno()}"
+    except (AttributeError, OSError):
+        fd_path = None
+    if fd_path is not None and os.path.exists(fd_path):
+        return fd_path
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    source.seek(0)
+    return source
+
+
+def get_iso_temporal_expr(name: str, dtype: pl.PolarsDataType, fmt: str) -> pl.Expr:
+    value = pl.col(name)
+    if dtype != pl.Date:
+        value = value.str.replace("T", " ")
+    return value.str.strptime(dtype, fmt, strict=False)
+
+
+def parse_iso_temporal_columns(df: pl.DataFrame) -> pl.DataFrame:
+    """Parses string columns whose every value is an ISO 8601 date or datetime.
+
+    Candidates are picked from the first rows, then kept only if every value parses.
+    """
+    sample = df.head(ISO_TEMPORAL_DETECTION_ROWS)
+    schema = {}
+    for name, dtype in df.schema.items():
+        if dtype != pl.Utf8:
+            continue
+        values = sample[name].drop_nulls().to_list()
+        if not values:
+            continue
+        for pattern, temporal_dtype, fmt in ISO_TEMPORAL_FORMATS:
+            if all(pattern.fullmatch(value) for value in values):
+                schema[name] = (temporal_dtype, fmt)
+                break
+    if not schema:
+        return df
+    parsed_df = df.select(
+        [get_iso_temporal_expr(name, *schema[name]) for name in schema]
+    )
+    null_counts = df.select(list(schema)).null_count().row(0)
+    parsed_null_counts = parsed_df.null_count().row(0)
+    return df.with_columns(
+        [
+            parsed_df[name]
+            for name, null_count, parsed_null_count in zip(
+                schema, null_counts, parsed_null_counts
+            )
+            if parsed_null_count == null_count
+        ]
+    )
+
+
+def cast_to_csv_schema(df: pl.DataFrame) -> pl.DataFrame:
+    """Casts a frame of datastore records to the dtypes read_csv_with_schema infers.
+
+    Numeric fields holding only whole numbers become Int64, text fields are cast to
+    the narrowest of Int64 and Float64 that holds all of their values, and ISO 8601
+    dates and datetimes are parsed.
+    """
+    float_columns = [name for name, dtype in df.schema.items() if dtype == pl.Float64]
+    if float_columns:
+        whole = df.select(
+            [(pl.col(name).drop_nulls() % 1 == 0).all() for name in float_columns]
+        ).row(0)
+        df = df.with_columns(
+            [
+                pl.col(name).cast(pl.Int64)
+                for name, is_whole in zip(float_columns, whole)
+                if is_whole
+            ]
+        )
+    df = df.with_columns(
+        [
+            pl.col(name).cast(pl.Datetime("ms"))
+            for name, dtype in df.schema.items()
+            if dtype == pl.Datetime
+        ]
+    )
+    failed_columns = [name for name, dtype in df.schema.items() if dtype == pl.Utf8]
+    for dtype in FALLBACK_DTYPES:
+        if not failed_columns:
+            break
+        df, failed_columns = cast_columns_verified(
+            df, {name: dtype for name in failed_columns}
+        )
+    return parse_iso_temporal_columns(df)
+
+
+def get_schema_key(resource: package_show.Resource) -> str:
+    return get_cache_key("schema", resource.id, resource.hash, resource.last_modified)
+
+
+def get_schema_names(df: pl.DataFrame) -> dict[str, str]:
+    # the same dtype names as a profile
+    return {name: str(dtype) for name, dtype in df.schema.items()}
+
+
+def read_schema(
+    resource: package_show.Resource, cache: DiskCache = None
+) -> Union[dict[str, str], None]:
+    """Returns the dtype names of the last DataFrame parsed from resource, if cached."""
+    use_cache = cache or get_default_cache()
+    path = use_cache.get(get_schema_key(resource), SCHEMA_CACHE_SUFFIX)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_schema(
+    resource: package_show.Resource, schema: dict[str, str], cache: DiskCache = None
+):
+    use_cache = cache or get_default_cache()
+    key = get_schema_key(resource)
+    if use_cache.contains(key, SCHEMA_CACHE_SUFFIX):
+        return
+    with use_cache.writer(key, SCHEMA_CACHE_SUFFIX) as f:
+        f.write(json.dumps(schema, separators=(",", ":")).encode("utf-8"))
+
+
+SCAN_DTYPES = {
+    str(dtype): dtype for dtype in (pl.Int64, pl.Float64, pl.Utf8, pl.Boolean)
+}
+
+
+def get_scan_dtypes(
+    schema: dict[str, str],
+) -> tuple[dict[str, pl.PolarsDataType], list[pl.Expr]]:
+    """Returns the dtypes to scan a CSV with and the expressions that parse its dates.
+
+    schema holds dtype names, e.g. from a profile. The CSV reader does not parse
+    datetimes correctly, so temporal columns are read as strings and parsed the same
+    way as read_csv_with_schema. Other dtypes are read as strings.
+    """
+    temporal_dtypes = {
+        str(dtype): (dtype, fmt) for _, dtype, fmt in ISO_TEMPORAL_FORMATS
+    }
+    dtypes, exprs = {}, []
+    for name, dtype_name in schema.items():
+        if dtype_name in temporal_dtypes:
+            dtypes[name] = pl.Utf8
+            exprs.append(get_iso_temporal_expr(name, *temporal_dtypes[dtype_name]))
+        else:
+            dtypes[name] = SCAN_DTYPES.get(dtype_name, pl.Utf8)
+    return dtypes, exprs
+
+
+def read_csv_with_schema(
+    source: IO[bytes],
+    schema_inference: Union[SchemaInference, str],
+    resource: package_show.Resource = None,
+    sample_size: int = SCHEMA_INFERENCE_SAMPLE_SIZE,
+    n_rows: int = None,
+) -> pl.DataFrame:
+    """Reads a CSV in a single typed pass, with types inferred from the first rows.
+
+    In metadata mode the field types published with the resource override the
+    inferred ones. Columns with values after the sample that do not fit their type
+    fall back to the narrowest of Int64 and Float64 that holds all of their values,
+    otherwise they stay as strings. ISO 8601 dates and datetimes are parsed the same
+    way as the full mode, other datetime formats stay as strings. Unlike the full mode,
+    empty strings are read as nulls.
+    """
+    schema_inference = SchemaInference(schema_inference)
+    dtypes = {}
+    if schema_inference == SchemaInference.METADATA and resource is not None:
+        dtypes = get_schema_from_resource(resource)
+
+    csv_source = get_csv_source(source)
+    try:
+        df = pl.read_csv(
+            csv_source,
+            dtypes=dtypes,
+            infer_schema_length=sample_size,
+            n_rows=n_rows,
+            **CSV_OPTIONS,
+        )
+    except pl.ComputeError as e:
+        logger.debug(f"Values after the sample do not fit the inferred types - {e}")
+        df = read_csv_with_failed_columns_as_strings(
+            get_csv_source(source), dtypes, sample_size, n_rows
+        )
+    return parse_iso_temporal_columns(df)
+
+
+def read_csv_with_failed_columns_as_strings(
+    source: Union[str, IO[bytes]],
+    dtypes: dict[str, pl.PolarsDataType],
+    sample_size: int,
+    n_rows: int = None,
+) -> pl.DataFrame:
+    df = pl.read_csv(
+        source,
+        dtypes=dtypes,
+        infer_schema_length=sample_size,
+        ignore_errors=True,
+        n_rows=n_rows,
+        **CSV_OPTIONS,
+    )
+    typed_columns = [name for name, dtype in df.schema.items() if dtype != pl.Utf8]
+    if not typed_columns:
+        return df
+    if not isinstance(source, str):
+        source.seek(0)
+    # unparseable values were read as nulls, compare against the raw strings
+    strings_df = pl.read_csv(
+        source,
+        columns=typed_columns,
+        dtypes={name: pl.Utf8 for name in typed_columns},
+        n_rows=n_rows,
+        **CSV_OPTIONS,
+    )
+    null_counts = strings_df.null_count().row(0)
+    typed_null_counts = df.select(typed_columns).null_count().row(0)
+    failed_columns = [
+        name
+        for name, null_count, typed_null_count in zip(
+            typed_columns, null_counts, typed_null_counts
+        )
+        if typed_null_count > null_count
+    ]
+    failed_df = strings_df.select(failed_columns)
+    for dtype in FALLBACK_DTYPES:
+        if not failed_columns:
+            break
+        logger.debug(f"Columns failed to cast, retrying as {dtype} - {failed_columns}")
+        failed_df, failed_columns = cast_columns_verified(
+            failed_df, {name: dtype for name in failed_columns}
+        )
+    return df.with_columns(failed_df.get_columns())
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import re
+import threading
+from collections import Counter
+from typing import Union
+
+import numpy as np
+import polars as pl
+from loguru import logger
+from rapidfuzz import fuzz as rapidfuzz_fuzz, process as rapidfuzz_process
+from thefuzz.utils import full_process
+
+from govtech_data.models.api import CatalogueSearchPackage, SearchPackage
+from govtech_data.models.resources.package_show import Result as PackageShowModelResult
+from govtech_data.utils.cache import DiskCache, get_cache_key, get_default_cache
+from govtech_data.utils.catalogue import Catalogue
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+CATALOGUE_FIELD_WEIGHTS = {
+    "id": 2.0,
+    "title": 3.0,
+    "tags": 2.0,
+    "topics": 1.5,
+    "groups": 1.5,
+    "organization": 1.0,
+    "description": 1.0,
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PACKAGE_SEARCH_INDEX_CACHE_SUFFIX = ".package-search-index.json"
+CATALOGUE_DOCUMENTS_CACHE_SUFFIX = ".catalogue-documents.arrow"
+CATALOGUE_POSTINGS_CACHE_SUFFIX = ".catalogue-postings.arrow"
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def get_fingerprint(package_ids: list[str]) -> str:
+    return hashlib.sha256("\n".join(package_ids).encode("utf-8")).hexdigest()
+
+
+def process_query(name: str) -> str:
+    # the same preprocessing as thefuzz.process.extract with token_set_ratio
+    return full_process(full_process(name), force_ascii=True)
+
+
+class PackageSearchIndex:
+    """Package ids preprocessed for fuzzy search, persisted per package_list version.
+
+    The index is not a short list of candidates: every query scores every id with
+    token_set_ratio in a single call into rapidfuzz, so the results are the same as
+    thefuzz.process.extract over all ids. A short list of candidates sharing
+    character n-grams with the query was tried, but it dropped real matches and was
+    no faster than scoring all ids of the catalogue.
+    """
+
+    def __init__(
+        self,
+        package_ids: list[str],
+        fingerprint: str = None,
+        processed_ids: list[str] = None,
+    ):
+        self.package_ids = package_ids
+        self.fingerprint = fingerprint or get_fingerprint(package_ids)
+        self.processed_ids = processed_ids or [
+            full_process(package_id, force_ascii=True) for package_id in package_ids
+        ]
+
+    @classmethod
+    def build(cls, package_ids: list[str]) -> "PackageSearchIndex":
+        return cls(package_ids)
+
+    @classmethod
+    def load(cls, path: str) -> "PackageSearchIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        return cls(d["package_ids"], d["fingerprint"], d["processed_ids"])
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "fingerprint": self.fingerprint,
+                "package_ids": self.package_ids,
+                "processed_ids": self.processed_ids,
+            },
+            separators=(",", ":"),
+        )
+
+    def search(self, name: str, limit: int = 10) -> list[SearchPackage]:
+        results = rapidfuzz_process.extract(
+            process_query(name),
+            self.processed_ids,
+            scorer=rapidfuzz_fuzz.token_set_ratio,
+            processor=None,
+            limit=limit,
+        )
+        return [
+            SearchPackage(package_id=self.package_ids[i], score=int(round(score)))
+            for _, score, i in results
+        ]
+
+
+def search_package_ids_batch(
+    names: list[str], package_ids: list[str], limit: int = 10, workers: int = 1
+) -> list[SearchPackage]:
+    """Scores every name against every package id in a single similarity matrix.
+
+    Returns the best score of each package across the top limit results of every
+    name, which is the same as merging search_package for each name separately.
+    """
+    if not names or not package_ids:
+        return []
+    # the same preprocessing of the names and ids as search_package
+    scores = np.rint(
+        rapidfuzz_process.cdist(
+            [process_query(name) for name in names],
+            get_package_search_index(package_ids).processed_ids,
+            scorer=rapidfuzz_fuzz.token_set_ratio,
+            processor=None,
+            workers=workers,
+        )
+    ).astype(np.int64)
+    best_scores: dict[int, int] = {}
+    for row in scores:
+        for i in np.argsort(-row, kind="stable")[:limit]:
+            if row[i] > best_scores.get(i, -1):
+                best_scores[i] = int(row[i])
+    return sorted(
+        [
+            SearchPackage(package_id=package_ids[i], score=score)
+            for i, score in best_scores.items()
+        ],
+        key=lambda x: x.score,
+        reverse=True,
+    )
+
+
+_search_index: Union[PackageSearchIndex, None] = None
+_search_index_lock = threading.Lock()
+
+
+def get_package_search_index(
+    package_ids: list[str], cache: DiskCache = None
+) -> PackageSearchIndex:
+    """Returns the index of package_ids from memory or the disk cache.
+
+    The index is keyed on a fingerprint of package_ids, so it is built again
+    whenever package_list changes.
+    """
+    global _search_index
+    index = _search_index
+    if index is not None and index.package_ids is package_ids:
+        return index
+    fingerprint = get_fingerprint(package_ids)
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+    with _search_index_lock:
+        use_cache = cache or get_default_cache()
+        key = get_cache_key("package-search-index", fingerprint)
+        path = use_cache.get(key, PACKAGE_SEARCH_INDEX_CACHE_SUFFIX)
+        index = None
+        if path is not None:
+            try:
+                index = PackageSearchIndex.load(path)
+            except (OSError, ValueError, KeyError):
+                logger.debug(f"Unable to load package search index - {path}")
+        if index is None or index.fingerprint != fingerprint:
+            logger.debug("Building package search index")
+            index = PackageSearchIndex.build(package_ids)
+            with use_cache.writer(key, PACKAGE_SEARCH_INDEX_CACHE_SUFFIX) as f:
+                f.write(index.to_json().encode("utf-8"))
+        index.package_ids = package_ids
+        _search_index = index
+    return index
+
+
+def get_catalogue_fields(result: PackageShowModelResult) -> dict[str, str]:
+    organization = result.organization
+    return {
+        "id": result.name or result.id or "",
+        "title": result.title or "",
+        "description": result.description or "",
+        "tags": " ".join(i.display_name or i.name or "" for i in result.tags or []),
+        "groups": " ".join(i.title or i.name or "" for i in result.groups or []),
+        "organization": (
+            (organization.title or organization.name or "") if organization else ""
+        ),
+        "topics": " ".join(result.topics or []),
+    }
+
+
+class CatalogueSearchIndex:
+    """BM25 index over package_show metadata, weighted by CATALOGUE_FIELD_WEIGHTS.
+
+    Both tables are plain polars DataFrames so that they can be saved as Arrow IPC and
+    memory-mapped on load.
+    """
+
+    def __init__(self, documents: pl.DataFrame, postings: pl.DataFrame):
+        # documents: doc, package_id, title, length
+        # postings: term, doc, tf
+        self.documents = documents
+        self.postings = postings
+        self.average_length = (
+            documents["length"].mean() if len(documents) else None
+        ) or 1.0
+
+    @classmethod
+    def build(cls, results: list[PackageShowModelResult]) -> "CatalogueSearchIndex":
+        documents = {"doc": [], "package_id": [], "title": [], "length": []}
+        postings = {"term": [], "doc": [], "tf": []}
+        for doc, result in enumerate(results):
+            term_frequencies = Counter()
+            for field, text in get_catalogue_fields(result).items():
+                for token in tokenize(text):
+                    term_frequencies[token] += CATALOGUE_FIELD_WEIGHTS[field]
+            documents["doc"].append(doc)
+            documents["package_id"].append(result.name or result.id)
+            documents["title"].append(result.title)
+            documents["length"].append(sum(term_frequencies.values()))
+            for term, tf in term_frequencies.items():
+                postings["term"].append(term)
+                postings["doc"].append(doc)
+                postings["tf"].append(tf)
+        return cls(
+            pl.DataFrame(
+                documents,
+                schema={
+                    "doc": pl.UInt32,
+                    "package_id": pl.Utf8,
+                    "title": pl.Utf8,
+                    "length": pl.Float64,
+                },
+            ),
+            pl.DataFrame(
+                postings,
+                schema={"term": pl.Utf8, "doc": pl.UInt32, "tf": pl.Float64},
+            ).sort("term"),
+        )
+
+    @classmethod
+    def load(cls, documents_path: str, postings_path: str) -> "CatalogueSearchIndex":
+        return cls(
+            pl.read_ipc(documents_path, memory_map=True),
+            pl.read_ipc(postings_path, memory_map=True),
+        )
+
+    def save(self, documents_path: str, postings_path: str):
+        self.documents.write_ipc(documents_path, compression="uncompressed")
+        self.postings.write_ipc(postings_path, compression="uncompressed")
+
+    def search(self, query: str, limit: int = 10) -> list[CatalogueSearchPackage]:
+        terms = list(set(tokenize(query)))
+        if not terms or len(self.documents) == 0:
+            return []
+        number_of_documents = len(self.documents)
+        matches = self.postings.lazy().filter(pl.col("term").is_in(terms))
+        idf = (
+            matches.groupby("term")
+            .agg(pl.count().alias("df"))
+            .with_columns(
+                (
+                    1.0
+                    + (number_of_documents - pl.col("df") + 0.5) / (pl.col("df") + 0.5)
+                )
+                .log()
+                .alias("idf")
+            )
+        )
+        scores = (
+            matches.join(idf, on="term")
+            .join(self.documents.lazy().select(["doc", "length"]), on="doc")
+            .with_columns(
+                (
+                    pl.col("idf")
+                    * pl.col("tf")
+                    * (BM25_K1 + 1)
+                    / (
+                        pl.col("tf")
+                        + BM25_K1
+                        * (1 - BM25_B + BM25_B * pl.col("length") / self.average_length)
+                    )
+                ).alias("score")
+            )
+            .groupby("doc")
+            .agg(pl.col("score").sum())
+            .sort(["score", "doc"], descending=[True, False])
+            .head(limit)
+            .join(
+                self.documents.lazy().select(["doc", "package_id", "title"]), on="doc"
+            )
+            .sort(["score", "doc"], descending=[True, False])
+            .collect()
+        )
+        return [
+            CatalogueSearchPackage(
+                package_id=row["package_id"],
+                title=row["title"],
+                score=round(row["score"], 4),
+            )
+            for row in scores.to_dicts()
+        ]
+
+
+_catalogue_search_index: Union[tuple[str, CatalogueSearchIndex], None] = None
+_catalogue_search_index_lock = threading.Lock()
+
+
+def get_catalogue_search_index(
+    catalogue: Catalogue, cache: DiskCache = None
+) -> CatalogueSearchIndex:
+    """Returns the index of the catalogue snapshot from memory or the disk cache.
+
+    The index is keyed on the version of the snapshot, so it is built again whenever
+    a sync changes the package metadata.
+    """
+    global _catalogue_search_index
+    key = get_cache_key("catalogue-search-index", catalogue.get_version())
+    if _catalogue_search_index is not None and _catalogue_search_index[0] == key:
+        return _catalogue_search_index[1]
+    with _catalogue_search_index_lock:
+        use_cache = cache or get_default_cache()
+        documents_path = use_cache.get(key, CATALOGUE_DOCUMENTS_CACHE_SUFFIX)
+        postings_path = use_cache.get(key, CATALOGUE_POSTINGS_CACHE_SUFFIX)
+        index = None
+        if documents_path is not None and postings_path is not None:
+            try:
+                index = CatalogueSearchIndex.load(documents_path, postings_path)
+            except FileNotFoundError:
+                logger.debug("Catalogue search index was evicted")
+        if index is None:
+            logger.debug("Building catalogue search index")
+            index = CatalogueSearchIndex.build(catalogue.get_package_results())
+            with use_cache.writer(key, CATALOGUE_DOCUMENTS_CACHE_SUFFIX) as f:
+                index.documents.write_ipc(f, compression="uncompressed")
+            with use_cache.writer(key, CATALOGUE_POSTINGS_CACHE_SUFFIX) as f:
+                index.postings.write_ipc(f, compression="uncompressed")
+        _catalogue_search_index = (key, index)
+    return index
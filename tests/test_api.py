@@ -0,0 +1,21 @@
+from govtech_data.models.api import datastore_result_to_dataframe
+
+
+def test_datastore_result_keeps_mixed_type_values():
+    df = datastore_result_to_dataframe(
+        {
+            "fields": [
+                {"id": "text", "type": "text"},
+                {"id": "number", "type": "numeric"},
+                {"id": "count", "type": "int4"},
+            ],
+            "records": [
+                {"text": "1", "number": "1.5", "count": "n.a."},
+                {"text": 2, "number": 2, "count": 3},
+            ],
+        }
+    )
+
+    assert df["text"].to_list() == ["1", "2"]
+    assert df["number"].to_list() == [1.5, 2.0]
+    assert df["count"].to_list() == ["n.a.", "3"]
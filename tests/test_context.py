@@ -0,0 +1,60 @@
+import pytest
+
+from govtech_data.utils.context import DropOldestStrategy, PriorityPackingStrategy
+
+MESSAGES = [
+    {"role": "system", "content": "task"},
+    {"role": "user", "content": "average resale prices by town"},
+    {
+        "role": "assistant",
+        "content": None,
+        "function_call": {"name": "dataset_search", "arguments": "{}"},
+    },
+    {"role": "function", "name": "dataset_search", "content": "results"},
+    {"role": "function", "name": "get_dataset", "content": "{}"},
+    {"role": "system", "content": "dataset"},
+    {"role": "user", "content": "continue"},
+]
+
+
+def assert_calls_kept_with_results(packed: list[dict]):
+    for i, message in enumerate(packed):
+        if message.get("function_call"):
+            assert packed[i + 1]["role"] == "function"
+        if message["role"] == "function" and message["name"] == "dataset_search":
+            assert packed[i - 1].get("function_call")
+
+
+@pytest.mark.parametrize(
+    "messages_tokens",
+    [
+        # the call is the most expensive message
+        [10, 10, 100, 1, 10, 10, 10],
+        # the result is the most expensive message
+        [10, 10, 1, 100, 10, 10, 10],
+    ],
+)
+def test_priority_packing_drops_call_with_its_result(messages_tokens):
+    packed = PriorityPackingStrategy().pack(
+        MESSAGES, messages_tokens, 60, lambda message: 1
+    )
+
+    assert MESSAGES[2] not in packed
+    assert MESSAGES[3] not in packed
+    assert_calls_kept_with_results(packed)
+
+
+def test_priority_packing_keeps_call_of_latest_result():
+    packed = PriorityPackingStrategy().pack(
+        MESSAGES[:4], [10, 10, 100, 1], 30, lambda message: 1
+    )
+
+    assert packed == MESSAGES[:4]
+
+
+def test_drop_oldest_drops_call_with_its_result():
+    packed = DropOldestStrategy().pack(
+        MESSAGES, [10, 10, 10, 100, 10, 10, 10], 150, lambda message: 1
+    )
+
+    assert packed == MESSAGES[:2] + MESSAGES[4:]
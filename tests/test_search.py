@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+from govtech_data.utils import search
+from govtech_data.utils.cache import DiskCache
+from govtech_data.utils.search import get_package_search_index, search_package_ids_batch
+
+PACKAGE_LIST_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "json", "models", "package_list.json"
+)
+
+
+@pytest.fixture(scope="module")
+def package_ids() -> list[str]:
+    with open(PACKAGE_LIST_PATH) as f:
+        return json.load(f)["result"]
+
+
+@pytest.mark.parametrize(
+    "name", ["Résale prïces", "HDB résale flat prïces", "resale prices"]
+)
+def test_batch_scores_equal_single_search_scores(package_ids, name):
+    single = get_package_search_index(package_ids).search(name, limit=10)
+    batch = search_package_ids_batch([name], package_ids, limit=10)
+    assert [i.score for i in batch] == [i.score for i in single]
+    assert {i.package_id: i.score for i in batch} == {
+        i.package_id: i.score for i in single
+    }
+
+
+def test_package_search_index_is_persisted_per_package_list(
+    tmp_path, monkeypatch, package_ids
+):
+    cache = DiskCache(str(tmp_path))
+    index = get_package_search_index(list(package_ids), cache)
+    # as in a new process
+    monkeypatch.setattr(search, "_search_index", None)
+    loaded = get_package_search_index(list(package_ids), cache)
+    assert loaded is not index
+    assert loaded.processed_ids == index.processed_ids
+
+    changed = get_package_search_index(package_ids + ["new-dataset"], cache)
+    assert changed.fingerprint != index.fingerprint
+    assert changed.search("new dataset", limit=1)[0].package_id == "new-dataset"